@@ -27,11 +27,12 @@ class ArgumentGroup(object):
 
 
 class Argument(object):
-    """ A command line argument data holder. """
+    """ A command line argument data holder. A *tunable* argument may be
+    changed at runtime, by :class:`qpyapp.config.Config`. """
     def __init__(self, flags, action=None, nargs=None, const=None,
                  default=None, type=None, choices=None, required=None,
                  help=None, metavar=None, dest=None, version=None, proxy=None,
-                 group=None):
+                 group=None, tunable=False):
         self.flags = flags
         self.action = action
         self.nargs = nargs
@@ -46,11 +47,21 @@ class Argument(object):
         self.version = version
         self.proxy = None
         self.group = group
+        self.tunable = tunable
 
     @property
     def args(self):
         return self.flags
 
+    @property
+    def key(self):
+        """ The key of the argument in the parsed arguments dictionary. """
+        if self.dest:
+            return self.dest
+        longs = [flag for flag in self.flags if flag.startswith("--")]
+        flag = (longs or self.flags)[0]
+        return flag.lstrip("-").replace("-", "_")
+
     @property
     def kwargs(self):
         _kwargs = {}
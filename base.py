@@ -4,6 +4,75 @@
 Generalising the application concept.
 """
 
+## Lazy imports
+import importlib
+
+## Startup timing
+import time
+import collections
+
+## Parallel startup
+import sys
+
+## Tracing
+import os
+
+
+##############################
+## ----- Lazy Imports ----- ##
+##############################
+
+class LazyModule(object):
+    """ A stand-in for a module, which is only imported on first attribute
+    access. Heavy dependencies may thus be bound to module level names while
+    short-lived invocations which never use them do not pay for their
+    import. """
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _lazy_load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_lazy_name'])
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._lazy_load(), attr, value)
+
+    def __repr__(self):
+        return "<lazy module '{}'>".format(self.__dict__['_lazy_name'])
+
+
+def lazy_import(name):
+    """ Return a :class:`LazyModule` for the (dotted) module *name*. """
+    return LazyModule(name)
+
+
+## Metrics; lazy, as the metrics module itself depends on this one
+metrics = lazy_import('qpyapp.metrics')
+
+## Tracing; only imported by apps which trace
+tracing = lazy_import('qpyapp.tracing')
+
+## Thread pools; only imported by apps which start concurrently
+mpp = lazy_import('multiprocessing.pool')
+
+
+def resolve(spec):
+    """ Return the object *spec* refers to. A string such as
+    ``'qpyapp.loggers.SimpleLogger'`` is resolved by importing its module;
+    anything else is returned as is. """
+    if not isinstance(spec, basestring):
+        return spec
+
+    module_name, _, name = spec.rpartition('.')
+    return getattr(importlib.import_module(module_name), name)
+
 
 #############################
 ## ----- Application ----- ##
@@ -16,14 +85,67 @@ class Application(object):
     connect to remote objects, read user input, etc.; and **run**, which starts
     the main operation of the app. An *app* should also have an **exit**
     method, which should be called automatically when the run ends, either
-    properly or with an exception. """
+    properly or with an exception.
+
+    Entries of the component list may be component classes, or dotted paths
+    to them (e.g. ``'qpyapp.gitcomp.GitComp'``), in which case the
+    component's module is only imported when the app is instantiated. The
+    time it takes to import, initialise and start each component is recorded
+    in *startup_times*; if *report_startup* is ``True``, a summary of it is
+    prompted once the app has started.
+
+    Components are started after the components they depend on (see
+    :attr:`Component.depends`), and otherwise in their order of occurrence;
+    they exit in the reverse order. If *start_workers* is greater than 1,
+    components whose dependencies have all started are started concurrently,
+    in a pool of that many threads. An error raised while starting a
+    component is re-raised in the calling thread, once its concurrently
+    started peers are done, so it may be handled as usual. Components are
+    always initialised one by one, in their order of occurrence, as they
+    may overload the app for the ones after them (e.g. the git component
+    amends the description the argument parser reads); slow setup which
+    may run concurrently belongs in *start*.
+
+    If *trace_fname* is set, the app has a :class:`qpyapp.tracing.Tracer`
+    as its *tracer*, keeping the last *trace_size* spans, which is exported
+    to that file (where ``{pid}`` is replaced by the process id) on exit.
+    Each component's import, init, start and exit are traced, as is error
+    handling; *trace_sample_rate* is the fraction of the events traced by
+    event-driven apps. Without a tracer, nothing is traced. """
     _comp_classes = []
+    report_startup = False
+    start_workers = 1
+    _exited = False
+
+    trace_fname = None
+    trace_size = None
+    trace_sample_rate = 1.0
 
     def __init__(self):
+        ## Trace, if asked to
+        self.tracer = tracer = None
+        if self.trace_fname:
+            self.tracer = tracer = tracing.Tracer(
+                size=self.trace_size or tracing.SPANS,
+                sample_rate=self.trace_sample_rate)
+
         ## Initialise the components
         self.components = []
-        for comp_cls in self._comp_classes:
-            self.components.append(comp_cls(self))
+        self.startup_times = collections.OrderedDict()
+        for comp_spec in self._comp_classes:
+            _t0 = time.time()
+            comp_cls = resolve(comp_spec)
+            _t1 = time.time()
+            component = comp_cls(self)
+            _t2 = time.time()
+            self.components.append(component)
+            self.startup_times[component] = dict(import_=_t1 - _t0,
+                                                 init=_t2 - _t1)
+            if tracer is not None:
+                name = comp_cls.__name__
+                tracer.add(name + ".import", 'startup', _t0, _t1 - _t0)
+                tracer.add(name + ".init", 'startup', _t1, _t2 - _t1)
+        self._start_order = _start_order(self.components)
 
         ## Init
         self.started = False
@@ -31,28 +153,129 @@ class Application(object):
     def prompt(self, msg):
         print msg
 
+    def _span(self, name, cat):
+        """ A span of the app's tracer, or a no-op if it has none. """
+        if self.tracer is None:
+            return _no_span
+        return self.tracer.span(name, cat)
+
     def handle_error(self, exit=True):
-        for component in self.components:
-            component.handle_error(self)
+        with self._span('handle_error', 'error'):
+            for component in self.components:
+                component.handle_error(self)
 
         if exit:
             self.exit()
 
-    def start(self):
-        for component in self.components:
+    def _start_component(self, component):
+        """ Start *component*; return the exception info of a failure, or
+        ``None``. Even exits (e.g. after printing the usage) are caught, as
+        they must not end a pool thread. """
+        _t0 = time.time()
+        try:
             component.start()
+        except BaseException:
+            return sys.exc_info()
+        finally:
+            duration = time.time() - _t0
+            self.startup_times[component]['start'] = duration
+            if self.tracer is not None:
+                self.tracer.add(type(component).__name__ + ".start",
+                                'startup', _t0, duration)
+
+    def _start_components(self):
+        ## Sequential start
+        if self.start_workers <= 1:
+            for component in self._start_order:
+                exc_info = self._start_component(component)
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+            return
+
+        ## Concurrent start, layer by layer
+        pool = mpp.ThreadPool(self.start_workers)
+        try:
+            for layer in _start_layers(self._start_order):
+                if len(layer) == 1:
+                    failures = [self._start_component(layer[0])]
+                else:
+                    failures = pool.map(self._start_component, layer)
+                for exc_info in failures:
+                    if exc_info:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+        finally:
+            pool.close()
+
+    def start(self):
+        self._start_components()
         self.started = True
         self.running = False
 
+        ## Publish startup times
+        startup_seconds = metrics.gauge(
+            'component_startup_seconds',
+            "Time taken to import, initialise and start each component.")
+        for component, times in self.startup_times.iteritems():
+            for phase, seconds in times.iteritems():
+                startup_seconds.labels(component=type(component).__name__,
+                                       phase=phase.rstrip('_')).set(seconds)
+
+        if self.report_startup:
+            self.prompt(self.startup_summary())
+
+    def startup_summary(self):
+        """ Return a table of the time (in milliseconds) each component took
+        to import, initialise and start. """
+        lines = ["{:<24} {:>9} {:>9} {:>9} {:>9}".format(
+            "Component", "import", "init", "start", "total")]
+        totals = [0.0, 0.0, 0.0]
+        for component, times in self.startup_times.iteritems():
+            phases = [times.get(phase, 0.0)
+                      for phase in ('import_', 'init', 'start')]
+            totals = [total + phase for total, phase in zip(totals, phases)]
+            lines.append("{:<24} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                type(component).__name__,
+                *[1000 * phase for phase in phases + [sum(phases)]]))
+        lines.append("{:<24} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            "(all)", *[1000 * total for total in totals + [sum(totals)]]))
+        return "Startup times (ms):\n" + "\n".join(lines)
+
     def run(self):
         self.running = True
         self.running = False
         self.exit()
 
     def exit(self):
+        ## Exit once, even if an error handler has already exited
+        if self._exited:
+            return
+        self._exited = True
+
         ## We exit in an opposite order
-        for component in reversed(self.components):
-            component.exit()
+        for component in reversed(self._start_order):
+            with self._span(type(component).__name__ + ".exit", 'exit'):
+                component.exit()
+
+        if self.tracer is not None:
+            self.tracer.export(self.trace_fname.format(pid=os.getpid()))
+
+    def _hook_chain(self, name):
+        """ Return the bound *name* hooks of the components which override
+        it, in start order. """
+        base_hook = getattr(Component, name).__func__
+        return [getattr(component, name) for component in self._start_order
+                if getattr(type(component), name).__func__ is not base_hook]
+
+
+class _NoSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_span = _NoSpan()
 
 
 ###########################
@@ -67,7 +290,18 @@ class Component(object):
 
     The component list is an attribute of the class, not of a class instance.
     That means, the addition of components to a class may alter its properties,
-    methods, and in particular, it defines its signature. """
+    methods, and in particular, it defines its signature.
+
+    A component may list the components it *depends* on, either by class or
+    by class name; it is then started after them, and exits before them.
+    Listed components which the app does not have are ignored.
+
+    Event-driven apps also call the per-event hooks (:meth:`before_event`,
+    :meth:`after_event`, :meth:`event_done` and :meth:`on_batch`), but only
+    of components which override them; the others cost nothing per
+    event. """
+    depends = ()
+
     def __init__(self, app):
         pass
 
@@ -80,3 +314,81 @@ class Component(object):
     def exit(self):
         pass
 
+    def before_event(self, app, event):
+        """ Called before *app* processes *event*; if it returns ``False``,
+        the event is dropped. """
+        pass
+
+    def after_event(self, app, event):
+        """ Called after *app* has processed *event*. """
+        pass
+
+    def event_done(self, app, event):
+        """ Called once *app* is done with *event*, whether it was
+        processed, failed, dropped by a hook or merged into another. """
+        pass
+
+    def on_batch(self, app, count):
+        """ Called once the engine has no more events for now, with the
+        *count* of events in the batch. """
+        pass
+
+
+###############################
+## ----- Startup Order ----- ##
+###############################
+
+def _depends_on(component, other):
+    """ Whether *component* lists *other* among its dependencies. """
+    for dep in component.depends:
+        if isinstance(dep, basestring):
+            if any(cls.__name__ == dep for cls in type(other).__mro__):
+                return True
+        elif isinstance(other, dep):
+            return True
+    return False
+
+
+def _dependencies(components):
+    return dict((component, [other for other in components
+                             if other is not component and
+                             _depends_on(component, other)])
+                for component in components)
+
+
+def _start_order(components):
+    """ Order *components* so that each comes after its dependencies, keeping
+    their original order otherwise. """
+    deps = _dependencies(components)
+    order = []
+    placed = set()
+
+    def place(component, path):
+        if component in placed:
+            return
+        if component in path:
+            raise ValueError("Circular component dependency: {}".format(
+                " -> ".join(type(c).__name__ for c in path + [component])))
+        for dep in deps[component]:
+            place(dep, path + [component])
+        placed.add(component)
+        order.append(component)
+
+    for component in components:
+        place(component, [])
+    return order
+
+
+def _start_layers(order):
+    """ Split the dependency-sorted *order* into layers, each depending only
+    on the components of the previous layers. """
+    deps = _dependencies(order)
+    level = dict()
+    layers = []
+    for component in order:
+        index = 1 + max([level[dep] for dep in deps[component]] or [-1])
+        level[component] = index
+        if index == len(layers):
+            layers.append([])
+        layers[index].append(component)
+    return layers
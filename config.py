@@ -0,0 +1,189 @@
+"""
+.. config.py
+
+Runtime-reloadable configuration for apps.
+"""
+
+## Framework
+import qpyapp.base
+import qpyapp.args
+
+## Reloading
+import os
+import json
+import signal
+import threading
+import collections
+
+
+class Config(qpyapp.base.Component):
+    """ Combines the command line arguments with an optional JSON config
+    file, whose keys are the arguments' keys (see
+    :attr:`qpyapp.args.Argument.key`). The file is given by the app's
+    *config_fname* attribute, or else by a ``config`` argument; on startup,
+    arguments given explicitly on the command line take precedence over it.
+
+    The file is re-read on SIGHUP, and whenever it changes (it is polled
+    every *poll_interval* seconds in a background thread, so the app's main
+    loop never waits for it). Values which changed in the file are applied
+    to the app's *parsed_args* if their arguments are *tunable*, and passed
+    to the callbacks subscribed to them (see :meth:`subscribe`); e.g. the
+    :class:`qpyapp.loggers.SimpleLogger` follows ``verbosity``. The
+    component overloads the app with a *config* property. """
+    depends = ('ArgParser',)
+    poll_interval = 1.0
+
+    def __init__(self, app):
+        self.app = app
+        self.fname = None
+        self.settings = dict()
+        self._file_values = dict()
+        self._arguments = dict()
+        self._mtime = None
+        self._callbacks = collections.defaultdict(list)
+        self._reload = threading.Event()
+        self._stop = threading.Event()
+        self._watcher = None
+        self._sighup_handler = None
+
+        ## Overload
+        app_cls = type(app)
+        app_cls.config = property(lambda app: self)
+
+    def _on_sighup(self, signum, frame):
+        self._reload.set()
+
+    def subscribe(self, key, callback):
+        """ Call *callback* with the new value of *key* whenever it changes
+        at runtime. Callbacks are called from the watcher thread. """
+        self._callbacks[key].append(callback)
+
+    def _argument_map(self):
+        arguments = []
+        for component in self.app.components:
+            if isinstance(component, qpyapp.args.ArgParser):
+                arguments.extend(component.arguments)
+        return dict((arg.key, arg) for arg in arguments)
+
+    def _warn(self, msg, **kwargs):
+        try:
+            warning = self.app.warning
+        except AttributeError:
+            self.app.prompt(msg.format(**kwargs))
+        else:
+            warning(msg, **kwargs)
+
+    def _read(self):
+        """ Read the config file; return its values, converted by their
+        arguments' types, or ``None`` if it could not be read. """
+        try:
+            self._mtime = os.stat(self.fname).st_mtime
+            with open(self.fname) as config_file:
+                values = json.load(config_file)
+        except (IOError, OSError, ValueError) as err:
+            self._warn("Could not read config file {fname}: {err}",
+                       fname=self.fname, err=err)
+            return None
+
+        for key, value in values.items():
+            arg = self._arguments.get(key)
+            if arg is not None and arg.type is not None and \
+                    isinstance(value, basestring):
+                try:
+                    values[key] = arg.type(value)
+                except (TypeError, ValueError) as err:
+                    self._warn("Ignoring config key {key}={value!r}: {err}",
+                               key=key, value=value, err=err)
+                    del values[key]
+        return values
+
+    def start(self):
+        self._arguments = self._argument_map()
+        parsed_args = self.app.parsed_args
+        self.settings = dict(parsed_args)
+        self.fname = getattr(self.app, 'config_fname', None) or \
+            parsed_args.get('config')
+        if not self.fname:
+            return
+
+        ## Config file values override the defaults, but not explicit
+        ## command line arguments
+        self._file_values = self._read() or dict()
+        for key, value in self._file_values.iteritems():
+            arg = self._arguments.get(key)
+            if arg is None or self.settings.get(key) == arg.default:
+                self.settings[key] = value
+        parsed_args.update(self.settings)
+
+        ## Reload on SIGHUP; signal handlers may only be set from the main
+        ## thread, which is where apps are started
+        try:
+            self._sighup_handler = signal.signal(signal.SIGHUP,
+                                                 self._on_sighup)
+        except (AttributeError, ValueError):
+            pass
+
+        ## Watch for changes
+        self._watcher = threading.Thread(target=self._watch,
+                                         name="config-watcher")
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._stop.is_set():
+            self._reload.wait(self.poll_interval)
+            if self._stop.is_set():
+                return
+
+            ## Reload on demand, or if the file has changed
+            if self._reload.is_set():
+                self._reload.clear()
+            else:
+                try:
+                    mtime = os.stat(self.fname).st_mtime
+                except OSError:
+                    continue
+                if mtime == self._mtime:
+                    continue
+
+            self.reload()
+
+    def reload(self):
+        """ Re-read the config file and apply the tunable values which have
+        changed in it. """
+        values = self._read()
+        if values is None:
+            return
+
+        changed = [(key, value) for key, value in values.iteritems()
+                   if self._file_values.get(key, self) != value]
+        self._file_values = values
+        for key, value in changed:
+            arg = self._arguments.get(key)
+            if arg is None or not arg.tunable:
+                self._warn("Config key {key} is not tunable at runtime.",
+                           key=key)
+                continue
+
+            self.settings[key] = value
+            self.app.parsed_args[key] = value
+            for callback in self._callbacks[key]:
+                try:
+                    callback(value)
+                except StandardError as err:
+                    self._warn("Could not apply {key}={value}: {err}",
+                               key=key, value=value, err=err)
+
+    def exit(self):
+        self._stop.set()
+        self._reload.set()
+        if self._watcher is not None:
+            self._watcher.join(self.poll_interval)
+
+        ## Restore the previous SIGHUP handling
+        if self._sighup_handler is not None:
+            try:
+                signal.signal(signal.SIGHUP, self._sighup_handler)
+            except ValueError:
+                pass
+            self._sighup_handler = None
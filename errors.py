@@ -8,11 +8,9 @@ Error handlers for apps.
 import qpyapp.base
 import sys
 import traceback
-import pygments as pyg
-import pygments.lexers as pyglex
-import pygments.formatters as pygfrmt
-pytb = pyglex.get_lexer_by_name('pytb')
-term = pygfrmt.get_formatter_by_name('terminal256')
+
+## Highlighting; only loaded once an error is handled
+lgr = qpyapp.base.lazy_import('qpyapp.loggers')
 
 
 class ErrorPrinter(qpyapp.base.Component):
@@ -21,6 +19,6 @@ class ErrorPrinter(qpyapp.base.Component):
     def handle_error(self, app):
         exc_info = sys.exc_info()
         tb = ''.join(traceback.format_exception(*exc_info))
-        msg = self._err_sep + pyg.highlight(tb, lexer=pytb, formatter=term)
+        msg = self._err_sep + lgr.highlight_tb(tb)
         app.prompt(msg)
 
@@ -6,28 +6,85 @@ An event-driven application framework.
 
 ## Framework
 import qpyapp.base
+import qpyapp.metrics
+import time
+
+## Coalescing
+import sys
+import itertools
+import collections
 
 ## Prompting
 import pyslext.console as cns
+import qpyapp.output
 
 
 class DummyEngine(object):
     pass
 
 
+## Metrics
+_events = qpyapp.metrics.counter(
+    'events_total', "Events received from the engine.")
+_event_errors = qpyapp.metrics.counter(
+    'event_errors_total', "Events whose processing has failed.")
+_events_coalesced = qpyapp.metrics.counter(
+    'events_coalesced_total', "Events merged into a pending event.")
+
+
 class EventDrivenApplication(qpyapp.base.Application):
+    """ An app which processes the events of an engine.
+
+    If *buffered_prompt* is ``True``, prompted messages are coalesced by a
+    :class:`qpyapp.output.BufferedConsole`, and written at most
+    *prompt_refresh_rate* times a second; beyond *prompt_max_lines* lines
+    per write, messages are only counted. Either way, messages are written
+    via the engine if it is using the terminal; when buffered, they may be
+    written from the console's flusher thread, so the engine's *prompt* must
+    then be thread-safe.
+
+    Under overload, an app may shed load by coalescing events: if it defines
+    a *coalesce_key* method, returning the key of an event (or ``None`` for
+    events which may not be merged), the events of each batch are read ahead
+    into a buffer of up to *pending_limit* events. Once the buffer holds
+    *high_water* events, an event whose key is already pending is merged
+    into the pending one by *coalesce_merge* (the latest wins, by default),
+    keeping its place; *coalesced* counts the merged events. Pending events
+    are always processed, even if the engine goes off. """
     engine_class = None
     engine_kwargs = {}
 
+    coalesce_key = None
+    pending_limit = 1024
+    high_water = 768
+    coalesced = 0
+
     color_prompt = True
 
+    buffered_prompt = False
+    prompt_refresh_rate = qpyapp.output.REFRESH_RATE
+    prompt_max_lines = qpyapp.output.MAX_LINES
+    _console = None
+
+    _success_color = cns.color('green', bold=True)
+    _fail_color = cns.color('red', bold=True)
+    _no_color = cns.nocolor()
+
     ## Prompting
     def prompt(self, msg, fail=False, success=False):
         if success:
-            msg = cns.color('green', bold=True) + msg + cns.nocolor()
+            msg = self._success_color + msg + self._no_color
         elif fail:
-            msg = cns.color('red', bold=True) + msg + cns.nocolor()
+            msg = self._fail_color + msg + self._no_color
+
+        console = self._console
+        if console is not None:
+            console.write(msg)
+            return
+
+        self._write(msg)
 
+    def _write(self, msg):
         try:
             engine = self.engine
         except AttributeError:
@@ -42,6 +99,12 @@ class EventDrivenApplication(qpyapp.base.Application):
 
         print msg
 
+    def _print(self, msg):
+        """ Print *msg* directly, after the messages the console holds. """
+        if self._console is not None:
+            self._console.flush()
+        print msg
+
     ## Engine error handling
     def _handle_engine_error(self):
         msg = "Event-driven app could not start engine."
@@ -50,6 +113,7 @@ class EventDrivenApplication(qpyapp.base.Application):
 
     ## App error handling
     def _handle_app_error(self):
+        _event_errors.inc()
         msg = "Application failure."
         self.prompt(msg, fail=True)
         exit = False
@@ -61,18 +125,134 @@ class EventDrivenApplication(qpyapp.base.Application):
     def nodata(self, count):
         pass
 
+    def coalesce_merge(self, pending, event):
+        return event
+
     def stop(self):
-        print "Event-Driven App is stopping."
+        self._print("Event-Driven App is stopping.")
         self.running = False
         if self._engine_on:
-            print "Closing engine"
+            self._print("Closing engine")
             self.engine.close()
             self.prompt("Engine has stopped.")
             self._engine_on = False
 
+    def _make_dispatch(self):
+        """ Return the callable which handles an event: the app's *process*,
+        wrapped by the components' per-event hooks, if there are any. """
+        process = self.process
+        before = tuple(self._hook_chain('before_event'))
+        after = tuple(self._hook_chain('after_event'))
+        done = self._done_hooks = tuple(self._hook_chain('event_done'))
+        if not before and not after and not done:
+            return process
+
+        def dispatch(event):
+            try:
+                for hook in before:
+                    if hook(self, event) is False:
+                        return
+                process(event)
+                for hook in after:
+                    hook(self, event)
+            finally:
+                for hook in done:
+                    hook(self, event)
+
+        return dispatch
+
+    def _discard(self, event):
+        """ Call the *event_done* hooks of an event which is not processed
+        (e.g. it was merged into another). """
+        for hook in self._done_hooks:
+            hook(self, event)
+
+    def _coalesced_batch(self):
+        """ Yield the events of the engine's next batch, read ahead into the
+        pending buffer, and coalesced above its high-water mark. """
+        key_of = self.coalesce_key
+        merge = self.coalesce_merge
+        limit = self.pending_limit
+        high_water = self.high_water
+
+        ## Pending events by slot, and the latest pending slot of each key
+        pending = collections.OrderedDict()
+        latest = dict()
+        slots = itertools.count()
+        merged = 0
+        off = None
+
+        events = iter(self.engine)
+        try:
+            while True:
+
+                ## Read ahead, a bounded number of events per event yielded
+                pulled = 0
+                try:
+                    while events is not None and len(pending) < limit and \
+                            pulled < limit:
+                        event = next(events)
+                        pulled += 1
+                        try:
+                            key = key_of(event)
+                            if key is not None and key in latest and \
+                                    len(pending) >= high_water:
+                                slot = latest[key]
+                                old = pending[slot][1]
+                                new = merge(old, event)
+                                pending[slot] = key, new
+                                merged += 1
+                                for dropped in (old, event):
+                                    if dropped is not new:
+                                        self._discard(dropped)
+                                continue
+                        except StandardError:
+                            self._handle_app_error()
+                            key = None
+                        slot = next(slots)
+                        pending[slot] = key, event
+                        if key is not None:
+                            latest[key] = slot
+                except StopIteration:
+                    events = None
+                except self.engine.Off:
+                    off = sys.exc_info()
+                    events = None
+
+                if not pending:
+                    break
+                slot, (key, event) = pending.popitem(last=False)
+                if key is not None and latest.get(key) == slot:
+                    del latest[key]
+                yield event
+
+        finally:
+            ## Merged events never reach the run loop's count, but were
+            ## received all the same
+            if merged:
+                self.coalesced += merged
+                _events_coalesced.inc(merged)
+                _events.inc(merged)
+
+        ## The engine went off; now that its events are processed, say so
+        if off is not None:
+            raise off[0], off[1], off[2]
+
     def start(self):
+        if self.buffered_prompt:
+            self._console = qpyapp.output.BufferedConsole(
+                self._write, refresh_rate=self.prompt_refresh_rate,
+                max_lines=self.prompt_max_lines)
+
         super(EventDrivenApplication, self).start()
 
+        ## Precompute the event dispatch chain
+        self._dispatch = self._make_dispatch()
+        self._batch_hooks = tuple(self._hook_chain('on_batch'))
+        if self.tracer is not None:
+            self._dispatch = qpyapp.base.tracing.DispatchTracer(
+                self.tracer, self._dispatch)
+
         self._engine_on = False
 
         ## Prepare the engine
@@ -94,19 +274,31 @@ class EventDrivenApplication(qpyapp.base.Application):
 
         self.running = True
         _nodata_counter = 0
+        dispatch = self._dispatch
+        batch_hooks = self._batch_hooks
+        tracer = self.tracer
+        coalesce = self.coalesce_key is not None
+        _run_t0 = time.time()
 
         ## Run loop
         while self.running:
 
             ## Loop over the events
+            count = 0
+            if tracer is not None:
+                _batch_t0 = time.time()
+                dispatch.batch(_batch_t0)
+            if coalesce:
+                events = self._coalesced_batch()
+            else:
+                events = self.engine
             try:
 
                 ## As long as there's data, we'll be inside that loop
-                for event in self.engine:
+                for count, event in enumerate(events, 1):
 
-                    _nodata_counter = 0
                     try:
-                        self.process(event)
+                        dispatch(event)
                     except StandardError:
                         self._handle_app_error()
 
@@ -121,29 +313,58 @@ class EventDrivenApplication(qpyapp.base.Application):
                 self.running = False
 
             else:
+                if count:
+                    _nodata_counter = 0
+                for hook in batch_hooks:
+                    try:
+                        hook(self, count)
+                    except StandardError:
+                        self._handle_app_error()
+
                 ## User has not wished to abort, but there's no data
                 ## The app should do something about it
                 ## Currently, it doesn't mean we're not running any more
                 _nodata_counter += 1
                 self.nodata(_nodata_counter)
 
-        print "Done; going to exit app."
+            ## Events are counted per batch, not to slow the loop down
+            _events.inc(count)
+            if tracer is not None and count and tracer.sampled():
+                tracer.add('batch', 'engine', _batch_t0,
+                           time.time() - _batch_t0, count=count)
+
+        if tracer is not None:
+            tracer.add('run', 'app', _run_t0, time.time() - _run_t0)
+        self._print("Done; going to exit app.")
         self.exit()
 
     def exit(self):
-        print "Exiting app."
+        if self._exited:
+            return
+
+        self._print("Exiting app.")
         try:
             engine = self.engine
         except AttributeError:
-            print "I HAVE NO ENGINE!!!"
-            return
-
-        if self._engine_on:
-            print "Closing engine"
-            engine.close()
-            self.prompt("Engine has stopped.")
-            self._engine_on = False
-
-        print "Hopefully, engine is closed; nothing should run any more."
-        self.prompt("You may need to press enter, and/or wait a few seconds.")
+            self._print("I HAVE NO ENGINE!!!")
+        else:
+            if self._engine_on:
+                self._print("Closing engine")
+                engine.close()
+                self.prompt("Engine has stopped.")
+                self._engine_on = False
+
+            self._print(
+                "Hopefully, engine is closed; nothing should run any more.")
+            self.prompt(
+                "You may need to press enter, and/or wait a few seconds.")
+
+        ## Exit the components
+        super(EventDrivenApplication, self).exit()
+
+        ## Write what is left, and stop buffering
+        console = self._console
+        if console is not None:
+            self._console = None
+            console.close()
 
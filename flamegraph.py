@@ -0,0 +1,347 @@
+"""
+.. flamegraph.py
+
+In-process rendering of profile stats: an interactive SVG icicle chart and a
+table of the hottest functions.
+"""
+
+## Profile stats
+import pstats
+
+## SVG
+import zlib
+import xml.sax.saxutils as xsu
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+WIDTH = 1200
+ROW_HEIGHT = 16
+FONT_SIZE = 11
+CHAR_WIDTH = 6.5
+PADDING = 10
+
+## Nodes narrower than this fraction of the total are not drawn; this bounds
+## the size of the chart for huge profiles
+MIN_FRACTION = 0.001
+MAX_DEPTH = 128
+
+TOP_N = 25
+
+
+###############################
+## ----- Stats Loading ----- ##
+###############################
+
+def load_stats(source):
+    """ Return the raw stats dictionary of *source*, which may be a file name
+    of a stats dump, a :class:`cProfile.Profile` or a :class:`pstats.Stats`
+    instance. The dictionary maps a function ``(filename, lineno, name)`` to
+    a ``(cc, nc, tt, ct, callers)`` tuple. """
+    if isinstance(source, pstats.Stats):
+        return source.stats
+    return pstats.Stats(source).stats
+
+
+def func_label(func):
+    """ Return a short human readable label of *func*. """
+    filename, lineno, name = func
+    if filename == '~':
+        ## Built-in functions
+        return name
+    return "{}:{}({})".format(filename, lineno, name)
+
+
+def _children_map(stats):
+    """ Invert the callers of *stats*: map each function to a list of
+    ``(callee, cumulative time)`` pairs, heaviest first. """
+    children = dict((func, []) for func in stats)
+    for func, (cc, nc, tt, ct, callers) in stats.iteritems():
+        for caller, edge in callers.iteritems():
+            ## cProfile records a (cc, nc, tt, ct) tuple per caller; older
+            ## dumps record a plain call count
+            edge_ct = edge[3] if isinstance(edge, tuple) else 0.0
+            children.setdefault(caller, []).append((func, edge_ct))
+
+    for callees in children.itervalues():
+        callees.sort(key=lambda pair: pair[1], reverse=True)
+
+    return children
+
+
+############################
+## ----- Flame Tree ----- ##
+############################
+
+class _Node(object):
+    __slots__ = ('func', 'width', 'children')
+
+    def __init__(self, func, width):
+        self.func = func
+        self.width = width
+        self.children = []
+
+
+def _build_node(stats, children, func, width, min_width, stack, depth):
+    node = _Node(func, width)
+    total = stats[func][3]
+    if total <= 0 or depth >= MAX_DEPTH:
+        return node
+
+    ## A callee's share of this node is its share of the function's total
+    ## cumulative time; the call graph does not record full stacks, so this
+    ## is the best apportioning we can do
+    callees = [(callee, edge_ct) for callee, edge_ct in children.get(func, ())
+               if callee not in stack]
+    edges_total = sum(edge_ct for callee, edge_ct in callees)
+
+    ## With recursion, the callees' cumulative times may add up to more than
+    ## the function's own; they are scaled down to fit in the node
+    scale = width / max(total, edges_total)
+    stack.add(func)
+    for callee, edge_ct in callees:
+        child_width = edge_ct * scale
+        if child_width < min_width:
+            continue
+        node.children.append(_build_node(stats, children, callee,
+                                         child_width, min_width, stack,
+                                         depth + 1))
+    stack.discard(func)
+    return node
+
+
+def _reachable(children, func):
+    """ Return the set of functions *func* calls, directly or not. """
+    seen = set()
+    pending = [func]
+    while pending:
+        for callee, edge_ct in children.get(pending.pop(), ()):
+            if callee not in seen:
+                seen.add(callee)
+                pending.append(callee)
+    return seen
+
+
+def _edge_calls(edge):
+    return edge[0] if isinstance(edge, tuple) else edge
+
+
+def _entry_time(stats, children, func):
+    """ Return the cumulative time of the calls to *func* which were not
+    made by another profiled function, or 0 if there were none. Calls made
+    within a recursion through *func* are part of its outer calls. """
+    cc, nc, tt, ct, callers = stats[func]
+    if not callers:
+        return ct
+    if nc <= sum(_edge_calls(edge) for edge in callers.itervalues()):
+        return 0.0
+
+    ## Subtract the time of the calls from outside the recursion
+    recursive = _reachable(children, func)
+    outer = sum(edge[3] for caller, edge in callers.iteritems()
+                if caller not in recursive and isinstance(edge, tuple))
+    return max(ct - outer, 0.0)
+
+
+def build_tree(stats, min_fraction=MIN_FRACTION):
+    """ Build a flame tree out of *stats*. Return the root node, which
+    represents the whole profile, and its total time. """
+    children = _children_map(stats)
+
+    ## Roots are functions which were called other than by profiled
+    ## functions (e.g. a recursive entry function)
+    entry_times = dict((func, _entry_time(stats, children, func))
+                       for func in stats)
+    roots = [func for func, width in entry_times.iteritems() if width > 0]
+    total = sum(entry_times[func] for func in roots)
+    if total <= 0:
+        ## Nothing has a caller-free entry (e.g. merged dumps); fall back to
+        ## the heaviest function
+        roots = sorted(stats, key=lambda func: stats[func][3])[-1:]
+        entry_times = dict((func, stats[func][3]) for func in roots)
+        total = sum(entry_times.itervalues())
+
+    root = _Node(('', 0, 'all'), total)
+    min_width = total * min_fraction
+    for func in sorted(roots, key=entry_times.get, reverse=True):
+        width = entry_times[func]
+        if width < min_width:
+            continue
+        root.children.append(_build_node(stats, children, func, width,
+                                         min_width, set(), 1))
+    return root, total
+
+
+####################################
+## ----- Hot Function Table ----- ##
+####################################
+
+def top_functions(stats, n=TOP_N, sort='self'):
+    """ Return the *n* hottest functions in *stats* as a list of
+    ``(func, tt, ct, nc, cc)`` tuples, sorted by self time (*sort* is
+    ``'self'``) or by cumulative time (``'cumulative'``). """
+    index = 1 if sort == 'self' else 2
+    rows = [(func, tt, ct, nc, cc)
+            for func, (cc, nc, tt, ct, callers) in stats.iteritems()]
+    rows.sort(key=lambda row: row[index], reverse=True)
+    return rows[:n]
+
+
+def _table_lines(stats, n, total):
+    header = "{:>10} {:>7} {:>10} {:>10}  {}".format(
+        "self (s)", "self %", "cum (s)", "calls", "function")
+    lines = [header]
+    for func, tt, ct, nc, cc in top_functions(stats, n):
+        pct = 100.0 * tt / total if total else 0.0
+        calls = str(nc) if nc == cc else "{}/{}".format(nc, cc)
+        lines.append("{:>10.4f} {:>6.2f}% {:>10.4f} {:>10}  {}".format(
+            tt, pct, ct, calls, func_label(func)))
+    return lines
+
+
+def format_top(stats, n=TOP_N):
+    """ Return a text table of the *n* functions with the most self time. """
+    total = sum(value[2] for value in stats.itervalues())
+    return "\n".join(_table_lines(stats, n, total)) + "\n"
+
+
+#####################
+## ----- SVG ----- ##
+#####################
+
+_SCRIPT = """
+var W = %(width)d, P = %(padding)d;
+function zoom(g) {
+  var x = parseFloat(g.getAttribute("data-x")),
+      w = parseFloat(g.getAttribute("data-w")),
+      d = parseInt(g.getAttribute("data-d"));
+  var frames = document.querySelectorAll("g.f");
+  for (var i = 0; i < frames.length; i++) {
+    var f = frames[i],
+        fx = parseFloat(f.getAttribute("data-x")),
+        fw = parseFloat(f.getAttribute("data-w")),
+        fd = parseInt(f.getAttribute("data-d"));
+    var inside = fx >= x - 1e-9 && fx + fw <= x + w + 1e-9,
+        above = fd < d && fx <= x + 1e-9 && fx + fw >= x + w - 1e-9;
+    if (!inside && !above) { f.style.display = "none"; continue; }
+    f.style.display = "";
+    var nx = above ? 0 : (fx - x) / w, nw = above ? 1 : fw / w;
+    var r = f.getElementsByTagName("rect")[0],
+        t = f.getElementsByTagName("text")[0];
+    r.setAttribute("x", P + nx * W);
+    r.setAttribute("width", Math.max(nw * W - 1, 0.5));
+    t.setAttribute("x", P + nx * W + 3);
+    var label = f.getAttribute("data-l"),
+        chars = Math.floor((nw * W - 6) / %(char_width)s);
+    t.textContent = chars < 3 ? "" :
+        (label.length <= chars ? label : label.slice(0, chars - 2) + "..");
+  }
+}
+"""
+
+
+def _color(func):
+    """ A stable warm color per function name. """
+    v = zlib.crc32(func[2]) & 0xffffffff
+    red = 200 + v % 56
+    green = 80 + (v >> 8) % 130
+    blue = 40 + (v >> 16) % 50
+    return "rgb({},{},{})".format(red, green, blue)
+
+
+def _label(text, width):
+    chars = int((width - 6) / CHAR_WIDTH)
+    if chars < 3:
+        return ""
+    if len(text) <= chars:
+        return text
+    return text[:chars - 2] + ".."
+
+
+def _frames(node, total, x, depth, out):
+    """ Append the SVG frames of *node* and its descendants to *out*, breadth
+    of each frame proportional to its time; *x* is the node's offset as a
+    fraction of the total. """
+    fraction = node.width / total
+    width = fraction * WIDTH
+    if depth == 0:
+        label = "all ({:.3f} s)".format(total)
+    else:
+        label = node.func[2]
+    title = "{} -- {:.4f} s, {:.2f}%".format(
+        "all" if depth == 0 else func_label(node.func), node.width,
+        100.0 * fraction)
+    px = PADDING + x * WIDTH
+    py = PADDING * 3 + depth * ROW_HEIGHT
+    out.append(
+        '<g class="f" data-x="{x!r}" data-w="{w!r}" data-d="{d}" '
+        'data-l={l} onclick="zoom(this)"><title>{t}</title>'
+        '<rect x="{px:.2f}" y="{py}" width="{rw:.2f}" height="{rh}" '
+        'fill="{c}" rx="2"/>'
+        '<text x="{tx:.2f}" y="{ty}">{txt}</text></g>'.format(
+            x=x, w=fraction, d=depth,
+            l=xsu.quoteattr(label), t=xsu.escape(title),
+            px=px, py=py, rw=max(width - 1, 0.5), rh=ROW_HEIGHT - 1,
+            c="rgb(230,230,230)" if depth == 0 else _color(node.func),
+            tx=px + 3, ty=py + ROW_HEIGHT - 4,
+            txt=xsu.escape(_label(label, width))))
+
+    offset = x
+    for child in node.children:
+        _frames(child, total, offset, depth + 1, out)
+        offset += child.width / total
+
+
+def _depth(node):
+    if not node.children:
+        return 1
+    return 1 + max(_depth(child) for child in node.children)
+
+
+def render_svg(stats, fname, title="Profile", top=TOP_N,
+               min_fraction=MIN_FRACTION):
+    """ Render *stats* (see :func:`load_stats`) into an SVG file at *fname*:
+    an icicle chart of the call tree (click a frame to zoom into it, click
+    the top frame to reset), followed by a table of the *top* functions with
+    the most self time. """
+    stats = load_stats(stats) if not isinstance(stats, dict) else stats
+    root, total = build_tree(stats, min_fraction)
+
+    frames = []
+    if total > 0:
+        _frames(root, total, 0.0, 0, frames)
+    chart_height = _depth(root) * ROW_HEIGHT
+
+    self_total = sum(value[2] for value in stats.itervalues())
+    table = _table_lines(stats, top, self_total) if top else []
+    table_y = PADDING * 5 + chart_height
+    height = table_y + (len(table) + 1) * ROW_HEIGHT + PADDING
+
+    out = [
+        '<?xml version="1.0" standalone="no"?>',
+        '<svg version="1.1" xmlns="http://www.w3.org/2000/svg" '
+        'width="{w}" height="{h}" font-family="monospace" '
+        'font-size="{fs}">'.format(w=WIDTH + 2 * PADDING, h=height,
+                                   fs=FONT_SIZE),
+        '<style>g.f:hover rect {stroke: black; stroke-width: 0.5} '
+        'g.f {cursor: pointer}</style>',
+        '<script type="text/ecmascript"><![CDATA[' + _SCRIPT % dict(
+            width=WIDTH, padding=PADDING, char_width=CHAR_WIDTH) +
+        ']]></script>',
+        '<rect width="100%" height="100%" fill="white"/>',
+        '<text x="{x}" y="{y}" font-size="{fs}">{t}</text>'.format(
+            x=PADDING, y=PADDING * 2, fs=FONT_SIZE + 3, t=xsu.escape(title)),
+    ]
+    out.extend(frames)
+    for i, line in enumerate(table):
+        out.append(
+            '<text x="{x}" y="{y}" xml:space="preserve"{b}>{t}</text>'.format(
+                x=PADDING, y=table_y + i * ROW_HEIGHT,
+                b=' font-weight="bold"' if i == 0 else "",
+                t=xsu.escape(line)))
+    out.append('</svg>')
+
+    with open(fname, 'w') as svg:
+        svg.write("\n".join(out) + "\n")
@@ -0,0 +1,157 @@
+"""
+.. gctune.py
+
+Garbage collector tuning and pause measurement for apps.
+"""
+
+## Framework
+import qpyapp.base
+import qpyapp.metrics
+ed = qpyapp.base.lazy_import('qpyapp.eventdriven')
+import gc
+import time
+import types
+
+
+##########################
+## ----- GC Tuner ----- ##
+##########################
+
+class GCTuner(qpyapp.base.Component):
+    """ Tunes the cyclic garbage collector and measures its pauses.
+
+    Generation thresholds are taken from the app's *gc_thresholds* attribute,
+    or else from a ``gc_thresholds`` argument (e.g. ``"50000,20,100"``).
+    Once the app has started, its startup garbage is collected and, unless
+    the app's *gc_freeze* is ``False``, all surviving objects are frozen out
+    of future collections (where :func:`gc.freeze` is available).
+
+    Every collection's pause is measured into *pauses*, a
+    :class:`qpyapp.metrics.Histogram` per generation. Where
+    :data:`gc.callbacks` is not available, automatic collection of
+    event-driven apps is disabled and done by the component instead, between
+    events, by the same thresholds (other apps keep automatic collection,
+    unmeasured); the app's *gc_manual* attribute may force this mode either
+    way. The time each event takes to process is measured into
+    *event_latency*, and both are reported on exit. """
+    depends = ('ArgParser',)
+
+    def __init__(self, app):
+        self.app = app
+        pauses = qpyapp.metrics.histogram(
+            'gc_pause_seconds', "Garbage collection pauses, per generation.")
+        self.pauses = [pauses.labels(generation=generation)
+                       for generation in range(3)]
+        self.event_latency = qpyapp.metrics.histogram(
+            'event_latency_seconds', "Time taken to process an event.")
+
+        ## Only event-driven apps call the per-event hooks, which collect in
+        ## manual mode
+        self.manual = getattr(
+            app, 'gc_manual', not hasattr(gc, 'callbacks') and
+            isinstance(app, ed.EventDrivenApplication))
+        self.callback = not self.manual and hasattr(gc, 'callbacks')
+        self._gc_start = None
+        self._event_start = None
+
+        ## Wrap the app's start method, to tune once the app has started
+        app._gc_tuned_start = app.start
+
+        def start(app):
+            app._gc_tuned_start()
+            self._freeze()
+
+        app.start = types.MethodType(start, app, type(app))
+
+    def _thresholds(self):
+        thresholds = getattr(self.app, 'gc_thresholds', None)
+        if thresholds is None:
+            try:
+                thresholds = self.app.parsed_args.get('gc_thresholds')
+            except AttributeError:
+                pass
+        if isinstance(thresholds, basestring):
+            thresholds = [int(value) for value in thresholds.split(",")]
+        return thresholds
+
+    def start(self):
+        thresholds = self._thresholds()
+        if thresholds:
+            gc.set_threshold(*thresholds)
+
+        if self.manual:
+            gc.disable()
+        elif self.callback:
+            gc.callbacks.append(self._on_gc)
+
+    def _freeze(self):
+        self._collect(2)
+        if getattr(self.app, 'gc_freeze', True) and hasattr(gc, 'freeze'):
+            gc.freeze()
+
+    ## Automatic collection
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_start = time.time()
+        elif self._gc_start is not None:
+            self.pauses[info['generation']].observe(
+                time.time() - self._gc_start)
+            self._gc_start = None
+
+    ## Manual collection
+    def _collect(self, generation):
+        ## Collections are measured by the callback, if there is one
+        if self.callback:
+            gc.collect(generation)
+            return
+
+        _t0 = time.time()
+        gc.collect(generation)
+        self.pauses[generation].observe(time.time() - _t0)
+
+    def _maybe_collect(self):
+        """ Collect the oldest generation whose threshold is exceeded, the
+        way the interpreter would have. """
+        counts = gc.get_count()
+        thresholds = gc.get_threshold()
+        if counts[0] <= thresholds[0]:
+            return
+        for generation in (2, 1, 0):
+            if counts[generation] > thresholds[generation]:
+                self._collect(generation)
+                return
+
+    ## Per-event hooks
+    def before_event(self, app, event):
+        self._event_start = time.time()
+
+    def after_event(self, app, event):
+        self.event_latency.observe(time.time() - self._event_start)
+        if self.manual:
+            self._maybe_collect()
+
+    def on_batch(self, app, count):
+        if self.manual:
+            self._maybe_collect()
+
+    def report(self):
+        """ Return a summary of the GC pauses and the event latency. """
+        lines = ["GC pauses (gen {}): {}".format(generation, pauses.summary())
+                 for generation, pauses in enumerate(self.pauses)]
+        lines.append("Event latency: {}".format(self.event_latency.summary()))
+        return "\n".join(lines)
+
+    def exit(self):
+        if self.manual:
+            gc.enable()
+        elif self.callback:
+            try:
+                gc.callbacks.remove(self._on_gc)
+            except ValueError:
+                pass
+
+        try:
+            info = self.app.info
+        except AttributeError:
+            return
+        info("{report}", report=self.report())
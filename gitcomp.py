@@ -7,24 +7,181 @@ Git component for apps.
 ## App Framework
 import qpyapp.base
 
-## Git framework
-import git
+## Git framework; only imported when git has to be asked
+git = qpyapp.base.lazy_import('git')
 
+## Metadata cache
+import os
+import json
+import subprocess as sp
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
 
 _version_kwargs = dict(
     all=False, always=True, tags=True, long=True, abbrev=8, dirty="+"
 )
 
+## The metadata cache lives inside the git directory
+CACHE_FNAME = "qpyapp-meta.json"
+
+## Deployments without a git directory read their metadata from this file
+FROZEN_FNAME = "git-meta.json"
+
+## Diffs longer than this (in bytes) are truncated
+DIFF_LIMIT = 1 << 20
+
+
+#############################
+## ----- Git Metadata ----- ##
+#############################
+
+def _git_dir(workdir):
+    """ Return the git directory of the repository at *workdir*, or ``None``
+    if there is none. """
+    dot_git = os.path.join(workdir, '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+
+    ## Work trees and submodules have a .git file pointing at the git dir
+    try:
+        with open(dot_git) as dot_git_file:
+            line = dot_git_file.readline().strip()
+    except IOError:
+        return None
+    if line.startswith("gitdir:"):
+        return os.path.join(workdir, line[len("gitdir:"):].strip())
+    return None
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
+
+def _cache_key(git_dir):
+    """ The state of HEAD, the ref it points to and the index (whose
+    modification time also changes as git refreshes it). """
+    head = _read(os.path.join(git_dir, 'HEAD'))
+    ref = None
+    if head and head.startswith("ref:"):
+        ref_name = head[len("ref:"):].strip()
+        ref = _read(os.path.join(git_dir, ref_name))
+        if ref is None:
+            ## A packed ref
+            ref = _stat(os.path.join(git_dir, 'packed-refs'))
+    return [head, ref, _stat(os.path.join(git_dir, 'index'))]
+
+
+def _worktree_stamp(workdir, files):
+    """ The state (modification time and size) of the tracked *files*; a
+    change of any of them, even one which has not reached the index, changes
+    the stamp. It costs a stat per file, but no git subprocess. """
+    return hash(tuple(tuple(_stat(os.path.join(workdir, fname)) or ())
+                      for fname in files))
+
+
+def _fetch_meta(workdir):
+    """ Ask git for the essential metadata of the repository at *workdir*. """
+    repo = git.Repo(workdir)
+    _git = repo.git
+    files = [fname for fname in _git.ls_files(z=True).split("\0") if fname]
+    return dict(
+        branch=repo.active_branch.name,
+        version=_git.describe(**_version_kwargs),
+        sha=repo.commit().hexsha,
+        files=files,
+    )
+
+
+def _fetch_merged(workdir, branch):
+    output = git.Repo(workdir).git.branch(merged=True)
+    output_list = output.split("\n")
+
+    branches = set()
+    for line in output_list:
+        if len(line) > 0:
+            if line[0] == " " or line[0] == "*":
+                branches.add(line[2:])
+
+    branches -= set([branch])
+    return sorted(branches)
+
+
+def _fetch_diff(workdir, limit=DIFF_LIMIT):
+    """ Return the diff of the work tree against HEAD, truncated after
+    *limit* bytes; git is stopped rather than let to write a huge diff. """
+    proc = sp.Popen(['git', 'diff', 'HEAD'], cwd=workdir, stdout=sp.PIPE)
+    diff = proc.stdout.read(limit + 1)
+    if len(diff) > limit:
+        proc.kill()
+        diff = diff[:limit] + "\n... (diff truncated at {} bytes)\n".format(
+            limit)
+    proc.stdout.close()
+    proc.wait()
+
+    ## The diff is kept as JSON, so it has to be text
+    return diff.decode('utf8', 'replace')
+
+
+def freeze(fname=FROZEN_FNAME, workdir=None, diff_limit=DIFF_LIMIT):
+    """ Write the full metadata of the repository at *workdir* (defaults to
+    the current directory) to *fname*, to be read by :class:`GitComp` where
+    there is no git directory, e.g. in a deployment. """
+    workdir = workdir or os.getcwd()
+    meta = _fetch_meta(workdir)
+    meta['merged'] = _fetch_merged(workdir, meta['branch'])
+    meta['diff'] = _fetch_diff(workdir, diff_limit)
+    with open(fname, 'w') as frozen:
+        json.dump(meta, frozen)
+
+
+###############################
+## ----- Git Component ----- ##
+###############################
 
 class GitComp(qpyapp.base.Component):
+    """ Overloads the app with the *branch*, *version* and *git_data* of the
+    git repository at the current directory.
+
+    Git metadata is cached inside the git directory, keyed by HEAD, the
+    index and the tracked files' modification times and sizes, so that an
+    unchanged repository costs some stats rather than git subprocesses.
+    The merged branches and the diff are not cached, as they may change
+    with other branches and with the files' content. The
+    *git_data* (merged branches and the diff against HEAD, truncated after
+    the app's *git_diff_limit* bytes) is only computed once it is accessed.
+
+    Where there is no git directory, the metadata is read from the app's
+    *git_frozen_fname* (defaults to :data:`FROZEN_FNAME`), as written by
+    :func:`freeze`. """
     def __init__(self, app):
-        ## Get git date
+        self._workdir = os.getcwd()
+        self._diff_limit = getattr(app, 'git_diff_limit', DIFF_LIMIT)
+        self._frozen_fname = getattr(app, 'git_frozen_fname', FROZEN_FNAME)
+        self._git_data = None
+
+        ## Get git data
         self._init_git()
 
         ## Overload
         app_cls = type(app)
         app_cls.branch = property(lambda app: self.branch)
         app_cls.version = property(lambda app: self.version)
+        app_cls.git_data = property(lambda app: self.git_data)
 
         ## Amend description
         try:
@@ -35,37 +192,81 @@ class GitComp(qpyapp.base.Component):
             app_cls.description = property(
                 lambda app: "{} {}".format(self._orig_desc, self.version))
 
-        ## Fetch git general data
-        app.git_data = ""
-        app.git_data += self._commit_sha + "\n\n"
-        app.git_data += "Merged branches:\n"
-        merged = list(self._merged_branches())
-        for branch in merged:
-            app.git_data += "  " + branch + "\n"
-        diffs = self._diff
-        if diffs:
-            app.git_data += "\nDiffs:\n\n"
-            app.git_data += ("="*72+"\n").join(diffs)
-
     def _init_git(self):
-        self._repo = git.Repo()
-        self._branch = self._repo.active_branch
-        self.branch = self._branch.name
-        self._git = self._repo.git
-        self.version = self._git.describe(**_version_kwargs)
-        self._commit = self._repo.commit()
-        self._commit_sha = self._commit.hexsha
-        self._diff = self._git.diff("HEAD")
+        self._git_dir = _git_dir(self._workdir)
+
+        ## A deployment; use frozen metadata
+        if self._git_dir is None:
+            with open(self._frozen_fname) as frozen:
+                self._meta = json.load(frozen)
+
+        ## A repository; use cached metadata, unless it is stale
+        else:
+            self._cache_fname = os.path.join(self._git_dir, CACHE_FNAME)
+            self._meta = self._cached_meta()
+
+        self.branch = self._meta['branch']
+        self.version = self._meta['version']
+        self._commit_sha = self._meta['sha']
+
+    def _cached_meta(self):
+        key = _cache_key(self._git_dir)
+        try:
+            with open(self._cache_fname) as cache:
+                meta = json.load(cache)
+        except (IOError, ValueError):
+            pass
+        else:
+            if meta.get('key') == key and meta.get('stamp') == \
+                    _worktree_stamp(self._workdir, meta.get('files', ())):
+                return meta
+
+        ## Git may refresh the index while asked, so the key is taken anew
+        meta = _fetch_meta(self._workdir)
+        meta['key'] = _cache_key(self._git_dir)
+        meta['stamp'] = _worktree_stamp(self._workdir, meta['files'])
+        self._write_cache(meta)
+        return meta
+
+    def _write_cache(self, meta):
+        ## Write atomically, as other processes may read the cache
+        tmp_fname = "{}.{}".format(self._cache_fname, os.getpid())
+        try:
+            with open(tmp_fname, 'w') as cache:
+                json.dump(meta, cache)
+            os.rename(tmp_fname, self._cache_fname)
+        except (IOError, OSError):
+            pass
 
     def _merged_branches(self):
-        output = self._git.branch(merged=True)
-        output_list = output.split("\n")
+        try:
+            return self._meta['merged']
+        except KeyError:
+            return _fetch_merged(self._workdir, self.branch)
+
+    def _worktree_diff(self):
+        try:
+            return self._meta['diff']
+        except KeyError:
+            return _fetch_diff(self._workdir, self._diff_limit)
 
-        branches = set()
-        for line in output_list:
-            if len(line) > 0:
-                if output[0] == " " or output[0] == "*":
-                    branches.add(output[2:])
+    @property
+    def git_data(self):
+        """ The commit, merged branches and diff of the repository. """
+        if self._git_data is not None:
+            return self._git_data
 
-        branches -= set([self.branch])
-        return branches
+        ## Fetch git general data
+        self._meta['merged'] = merged = self._merged_branches()
+        self._meta['diff'] = diff = self._worktree_diff()
+
+        git_data = ""
+        git_data += self._commit_sha + "\n\n"
+        git_data += "Merged branches:\n"
+        for branch in merged:
+            git_data += "  " + branch + "\n"
+        if diff:
+            git_data += "\nDiffs:\n\n"
+            git_data += diff
+        self._git_data = git_data
+        return git_data
@@ -8,13 +8,170 @@ Host component for apps.
 import qpyapp.base
 import socket
 
+## Telemetry
+import os
+import gc
+import time
+import resource
+import threading
+import collections
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+## Number of samples kept per telemetry field
+TELEMETRY_SIZE = 600
+
+TELEMETRY_FIELDS = ('time', 'cpu_time', 'rss', 'fds', 'threads',
+                    'ctx_voluntary', 'ctx_involuntary', 'gc0', 'gc1', 'gc2')
+
+_clock_ticks = float(os.sysconf('SC_CLK_TCK')) \
+    if hasattr(os, 'sysconf') else 100.0
+_page_size = resource.getpagesize()
+
+
+##########################
+## ----- Sampling ----- ##
+##########################
+
+def _proc_stat():
+    """ CPU time (s), RSS (bytes) and thread count from /proc/self/stat. """
+    with open('/proc/self/stat') as stat_file:
+        stat = stat_file.read()
+
+    ## The command name may contain spaces; fields are counted after it
+    fields = stat[stat.rindex(')') + 2:].split()
+    cpu_time = (int(fields[11]) + int(fields[12])) / _clock_ticks
+    return cpu_time, int(fields[21]) * _page_size, int(fields[17])
+
+
+def _proc_ctx_switches():
+    voluntary = involuntary = 0
+    with open('/proc/self/status') as status_file:
+        for line in status_file:
+            if line.startswith('voluntary_ctxt_switches'):
+                voluntary = int(line.split()[1])
+            elif line.startswith('nonvoluntary_ctxt_switches'):
+                involuntary = int(line.split()[1])
+    return voluntary, involuntary
+
+
+def _rusage():
+    """ Fallback for systems without /proc. """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_time = usage.ru_utime + usage.ru_stime
+
+    ## This is the peak RSS, in kilobytes
+    rss = usage.ru_maxrss * 1024
+    return (cpu_time, rss, threading.active_count(), usage.ru_nvcsw,
+            usage.ru_nivcsw)
+
+
+def _fd_count():
+    for fd_dir in ('/proc/self/fd', '/dev/fd'):
+        try:
+            return len(os.listdir(fd_dir))
+        except OSError:
+            pass
+    return -1
+
+
+def sample():
+    """ Return a dictionary of the process' current resource usage, keyed by
+    :data:`TELEMETRY_FIELDS`. """
+    try:
+        cpu_time, rss, threads = _proc_stat()
+        ctx_voluntary, ctx_involuntary = _proc_ctx_switches()
+    except (IOError, OSError, ValueError, IndexError):
+        cpu_time, rss, threads, ctx_voluntary, ctx_involuntary = _rusage()
+
+    gc0, gc1, gc2 = gc.get_count()
+    return dict(time=time.time(), cpu_time=cpu_time, rss=rss,
+                fds=_fd_count(), threads=threads,
+                ctx_voluntary=ctx_voluntary, ctx_involuntary=ctx_involuntary,
+                gc0=gc0, gc1=gc1, gc2=gc2)
+
+
+################################
+## ----- Host Component ----- ##
+################################
 
 class HostComp(qpyapp.base.Component):
+    """ Overloads the app with its *hostname*, and with *telemetry*: a
+    dictionary of ring buffers (:class:`collections.deque`), one per
+    :data:`TELEMETRY_FIELDS`, holding the last *telemetry_size* samples of
+    the process' resource usage.
+
+    Sampling is done in a background thread every *telemetry_interval*
+    seconds, if the app has that attribute; if it also has a
+    *telemetry_log_every* attribute, every that many samples are logged at
+    the verbose level. The app's own threads only pay for reading the
+    buffers. """
     def __init__(self, app):
-        ## Get git data
+        self.app = app
+
+        ## Get host data
         self.hostname = socket.gethostname()
 
+        ## Telemetry
+        self.interval = getattr(app, 'telemetry_interval', None)
+        self.log_every = getattr(app, 'telemetry_log_every', None)
+        size = getattr(app, 'telemetry_size', TELEMETRY_SIZE)
+        self.telemetry = dict((field, collections.deque(maxlen=size))
+                              for field in TELEMETRY_FIELDS)
+        self._stop = threading.Event()
+        self._sampler = None
+
         ## Overload
         app_cls = type(app)
         app_cls.hostname = property(lambda app: self.hostname)
+        app_cls.telemetry = property(lambda app: self.telemetry)
+
+    def start(self):
+        if not self.interval:
+            return
+
+        self._sampler = threading.Thread(target=self._sample_loop,
+                                         name="telemetry")
+        self._sampler.daemon = True
+        self._sampler.start()
+
+    def _sample_loop(self):
+        count = 0
+        while not self._stop.is_set():
+            values = sample()
+            for field, value in values.iteritems():
+                self.telemetry[field].append(value)
+
+            count += 1
+            if self.log_every and count % self.log_every == 0:
+                self._log(values)
+
+            self._stop.wait(self.interval)
+
+    def _log(self, values):
+        try:
+            verbose = self.app.verbose
+        except AttributeError:
+            return
+
+        verbose("Telemetry: cpu {cpu_time:.2f} s, rss {rss_mib:.1f} MiB, "
+                "{fds} fds, {threads} threads, ctx switches "
+                "{ctx_voluntary}/{ctx_involuntary}, gc {gc0}/{gc1}/{gc2}",
+                rss_mib=values['rss'] / float(1 << 20), **values)
+
+    def latest(self):
+        """ Return the latest telemetry sample, or ``None`` if there is
+        none yet. """
+        try:
+            return dict((field, buf[-1])
+                        for field, buf in self.telemetry.iteritems())
+        except IndexError:
+            return None
 
+    def exit(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join(self.interval)
@@ -9,24 +9,31 @@ __log_proxy__ = 1
 
 ## Framework
 import qpyapp.base
+import qpyapp.metrics
 import logging
 logging.__log_proxy__ = 1
 import sys
 import datetime as dt
 import inspect
 import traceback
+import thread
+import string
+import re
 
 ## Console
 import pyslext.console as cns
-import pygments as pyg
-import pygments.lexers as pyglex
-import pygments.formatters as pygfrmt
-pytb = pyglex.get_lexer_by_name('pytb')
-term = pygfrmt.get_formatter_by_name('terminal256')
+pyg = qpyapp.base.lazy_import('pygments')
+pyglex = qpyapp.base.lazy_import('pygments.lexers')
+pygfrmt = qpyapp.base.lazy_import('pygments.formatters')
 
 ## File handlers
 import os
 import errno
+import time
+import mmap
+import atexit
+import threading
+import collections
 
 
 ##################################
@@ -35,6 +42,21 @@ import errno
 
 DATE_FMT = "%Y%m%d-%H:%M:%S.%f"
 
+## Log files are written through a shared pool, which keeps at most this many
+## files open...
+MAX_OPEN_FILES = 64
+
+## ... buffers up to this many bytes per file...
+FILE_BUFFER_SIZE = 1 << 16
+
+## ... flushes all buffers at least every that many seconds, and closes files
+## which have not been written to for that many seconds
+FILE_FLUSH_INTERVAL = 1.0
+FILE_IDLE_TIMEOUT = 60.0
+
+## Memory-mapped log files are preallocated by segments of this many bytes
+MMAP_SEGMENT_SIZE = 1 << 24
+
 
 ############################
 ## ----- Log Levels ----- ##
@@ -60,6 +82,24 @@ def level_map(x):
     return level_dict.get(x, NOTSET)
 
 
+########################################
+## ----- Traceback Highlighting ----- ##
+########################################
+
+## Resolving pygments' lexer and formatter is slow, so it is only done once a
+## traceback is actually highlighted
+_tb_highlighting = []
+
+
+def highlight_tb(tb):
+    """ Return traceback text *tb* highlighted for a 256 color terminal. """
+    if not _tb_highlighting:
+        _tb_highlighting[:] = [pyglex.get_lexer_by_name('pytb'),
+                               pygfrmt.get_formatter_by_name('terminal256')]
+    lexer, formatter = _tb_highlighting
+    return pyg.highlight(tb, lexer=lexer, formatter=formatter)
+
+
 ########################
 ## ----- Daemon ----- ##
 ########################
@@ -68,14 +108,17 @@ class _LoggerDaemon(object):
     root_name = 'root'
     root_path = "."
     loglevel = NOTSET
+    file_klass = 'file'
 
-    def setup(self, name=None, path=None, level=None):
+    def setup(self, name=None, path=None, level=None, file_klass=None):
         if name:
             self.root_name = name
         if path:
             self.root_path = path
         if level:
             self.loglevel = level
+        if file_klass:
+            self.file_klass = file_klass
 
 
 _logger_daemon = _LoggerDaemon()
@@ -86,15 +129,155 @@ setup = _logger_daemon.setup
 ## ----- Records ----- ##
 #########################
 
-class KWLogRecord(logging.LogRecord):
-    def __init__(self, *args, **kwargs):
-        super(KWLogRecord, self).__init__(*args, **kwargs)
-        self.levelmark = self.levelname[0]
-        self.func_name = "" if self.funcName == "<module>" else self.funcName
+def _record_filename(record):
+    try:
+        return os.path.basename(record.pathname)
+    except (TypeError, ValueError, AttributeError):
+        return record.pathname
+
+
+def _record_module(record):
+    try:
+        return os.path.splitext(record.filename)[0]
+    except (TypeError, ValueError, AttributeError):
+        return "Unknown module"
+
+
+def _record_thread_name(record):
+    thread = threading._active.get(record.thread)
+    return thread.name if thread is not None else str(record.thread)
+
+
+def _record_process_name(record):
+    multiprocessing = sys.modules.get('multiprocessing')
+    if multiprocessing is None:
+        return 'MainProcess'
+    try:
+        return multiprocessing.current_process().name
+    except StandardError:
+        return 'MainProcess'
+
+
+## Record attributes which are only computed once read; those which the
+## formatters always read are set on creation
+_lazy_record_attrs = dict(
+    msecs=lambda record: (record.created - int(record.created)) * 1000,
+    relativeCreated=lambda record:
+    (record.created - logging._startTime) * 1000,
+    threadName=_record_thread_name,
+    process=lambda record: os.getpid(),
+    processName=_record_process_name,
+)
+
+
+class KWLogRecord(object):
+    """ A compact log record, with the interface of
+    :class:`logging.LogRecord`. Only what is needed to tell what, when and
+    where, and what the formatters always read, is set on creation; the
+    rest of the attributes (see :data:`_lazy_record_attrs`) are computed,
+    and kept, once read. Extra attributes are kept aside, and the record's
+    ``__dict__`` is built on demand, for formatters which format with it. """
+    __slots__ = (
+        ## Set on creation
+        'name', 'msg', 'args', 'levelno', 'pathname', 'lineno', 'funcName',
+        'exc_info', 'exc_text', 'created', 'thread', '_extra', '_message',
+
+        ## Set on creation, as the formatters always read them
+        'levelname', 'levelmark', 'func_name', 'filename', 'module',
+
+        ## Lazy
+        'msecs', 'relativeCreated', 'threadName', 'process', 'processName',
+
+        ## Set by formatters
+        'message', 'asctime',
+    )
+
+    def __init__(self, name, level, pathname, lineno, msg, args, exc_info,
+                 func=None):
+        self.name = name
+        self.msg = msg
+
+        ## As python's original records, a sole non-empty dictionary
+        ## argument is taken as the arguments
+        if args and len(args) == 1 and isinstance(args[0], dict) and \
+                args[0]:
+            args = args[0]
+        self.args = args
+
+        self.levelno = level
+        self.pathname = pathname
+        self.lineno = lineno
+        self.funcName = func
+        self.levelname = levelname = logging.getLevelName(level)
+        self.levelmark = levelname[0]
+        self.func_name = "" if func == "<module>" else func
+        self.filename = _record_filename(self)
+        self.module = _record_module(self)
+        self.exc_info = exc_info
+        self.exc_text = None
+        self.created = time.time()
+        self.thread = thread.get_ident()
+        self._extra = None
+        self._message = None
+
+    def __getattr__(self, attr):
+        ## Only called for attributes which are not set
+        try:
+            compute = _lazy_record_attrs[attr]
+        except KeyError:
+            if attr == '_extra':
+                raise AttributeError(attr)
+            try:
+                return self._extra[attr]
+            except (KeyError, TypeError):
+                raise AttributeError(attr)
+
+        value = compute(self)
+        setattr(self, attr, value)
+        return value
+
+    def _attrs(self):
+        """ Return the record's slots which are (or may be computed) set. """
+        attrs = dict()
+        for attr in self.__slots__:
+            try:
+                attrs[attr] = getattr(self, attr)
+            except AttributeError:
+                pass
+        return attrs
+
+    @property
+    def __dict__(self):
+        attrs = self._attrs()
+        attrs.pop('_message', None)
+        extra = attrs.pop('_extra', None)
+        if extra:
+            attrs.update(extra)
+        return attrs
+
+    ## Pickling and copying; lazy attributes are computed first, as they
+    ## may not be computed in another process
+    def __getstate__(self):
+        return self._attrs()
+
+    def __setstate__(self, state):
+        self._extra = None
+        self._message = None
+        for attr, value in state.iteritems():
+            setattr(self, attr, value)
+
+    def __repr__(self):
+        return '<KWLogRecord: {}, {}, {}, {}, "{}">'.format(
+            self.name, self.levelno, self.pathname, self.lineno, self.msg)
 
     def getMessage(self):
         """ Return the message for this LogRecord after merging any
-        user-supplied arguments with the message. """
+        user-supplied arguments with the message. The message is rendered
+        once, and kept. """
+        message = self._message
+        if message is not None:
+            return message
+
         ## All of the following is python's original code, but we assume
         ## unicode is always supported
         msg = self.msg
@@ -108,20 +291,74 @@ class KWLogRecord(logging.LogRecord):
         ## We assume it is either a tuple containing one element, which is an
         ## empty dictionary (in which case no formatting should be made), or it
         ## is a non-empty dictionary (in which case formatting should be made)
-        try:
-            args = {}
-            for (k, v) in self.args.viewitems():
+        args = self.args
+        if not isinstance(args, dict):
+            message = msg
 
-                ## Unicode arg?
-                if type(v) is unicode:
-                    args[k] = v.encode('utf8')
-                else:
-                    args[k] = v
+        else:
+            literal, fields = _template(msg)
+
+            ## No replacement fields
+            if literal is not None:
+                message = literal
+
+            else:
+                ## Unicode args? Only those the template uses are encoded
+                if fields is None:
+                    fields = args.keys()
+                unicode_fields = [k for k in fields
+                                  if type(args.get(k)) is unicode]
+                if unicode_fields:
+                    args = dict(args)
+                    for k in unicode_fields:
+                        args[k] = args[k].encode('utf8')
+
+                try:
+                    message = msg.format(**args)
+                except AttributeError:
+                    message = msg
+
+        self._message = message
+        return message
+
+
+## Parsed message templates, by format string; the cache is cleared once it
+## holds too many
+_templates = dict()
+_MAX_TEMPLATES = 1024
+
+
+def _template(msg):
+    """ Return a ``(literal, fields)`` pair for format string *msg*: the
+    rendered message if it has no replacement fields (``None`` otherwise),
+    and the names of the arguments it uses (``None`` if they cannot be told,
+    e.g. with nested fields). """
+    try:
+        return _templates[msg]
+    except KeyError:
+        pass
 
-            return msg.format(**args)
+    literals = []
+    fields = set()
+    for literal, field_name, format_spec, conversion in \
+            string.Formatter().parse(msg):
+        literals.append(literal)
+        if field_name is None:
+            continue
+        if fields is not None:
+            fields.add(re.split(r"[.\[]", field_name, 1)[0])
+        if format_spec and "{" in format_spec:
+            fields = None
+
+    if fields is not None and not fields:
+        template = "".join(literals), ()
+    else:
+        template = None, (tuple(fields) if fields is not None else None)
 
-        except AttributeError:
-            return msg
+    if len(_templates) >= _MAX_TEMPLATES:
+        _templates.clear()
+    _templates[msg] = template
+    return template
 
 
 ############################
@@ -185,7 +422,7 @@ class ColorFormatter(SimpleFormatter):
 
     def format_exception(self, exc_info):
         exc = super(ColorFormatter, self).format_exception(exc_info)
-        return pyg.highlight(exc, lexer=pytb, formatter=term)
+        return highlight_tb(exc)
 
 
 ## TODO: temporary
@@ -194,6 +431,31 @@ class FullFormatter(SimpleFormatter):
         " :: {r.module}.{r.func_name}:{r.lineno} :: {r.message}"
 
 
+#########################
+## ----- Metrics ----- ##
+#########################
+
+_log_records = qpyapp.metrics.counter(
+    'log_records_total', "Log records handled, per handler and level.")
+_log_bytes = qpyapp.metrics.counter(
+    'log_bytes_total', "Bytes of log records written, per handler.")
+
+## Series per (handler, level), so records need not look up labels
+_handler_series = dict()
+
+
+def _meter(handler_kind, record, message):
+    try:
+        records, written = _handler_series[handler_kind, record.levelname]
+    except KeyError:
+        records = _log_records.labels(handler=handler_kind,
+                                      level=record.levelname)
+        written = _log_bytes.labels(handler=handler_kind)
+        _handler_series[handler_kind, record.levelname] = records, written
+    records.inc()
+    written.inc(len(message) + 1)
+
+
 ##########################
 ## ----- Handlers ----- ##
 ##########################
@@ -206,9 +468,304 @@ class PromptHandler(logging.Handler):
             pass
         else:
             message = self.format(record)
+            _meter('prompt', record, message)
             prompt(message)
 
 
+class FileHandler(logging.Handler):
+    """ A log file handler which writes through a :class:`_WriterPool`,
+    rather than holding a file of its own. Records of level ERROR and above
+    are flushed at once. """
+    def __init__(self, filename, pool=None):
+        logging.Handler.__init__(self)
+        self.baseFilename = os.path.abspath(filename)
+        self.pool = pool or _writer_pool
+
+    def createLock(self):
+        ## The pool serializes the writes of all handlers
+        self.lock = None
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            if isinstance(message, unicode):
+                message = message.encode('utf8')
+            _meter('file', record, message)
+            self.pool.write(self.baseFilename, message + "\n",
+                            urgent=record.levelno >= ERROR)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+    def flush(self):
+        self.pool.flush(self.baseFilename)
+
+    def close(self):
+        self.pool.release(self.baseFilename)
+        logging.Handler.close(self)
+
+
+#############################
+## ----- Writer Pool ----- ##
+#############################
+
+class _WriterPool(object):
+    """ Multiplexes the writes of all log file handlers: records are
+    appended to per-file buffers, which are written with a single write
+    call once full, flushed, or every *flush_interval* seconds (by a
+    background thread). Files are opened lazily, and at most *max_open* of
+    them are kept open; the least recently written one is closed to make
+    room, as are files idle for *idle_timeout* seconds. A forked child
+    starts over with a pool of its own, without the parent's buffers. """
+    def __init__(self, max_open=MAX_OPEN_FILES, buffer_size=FILE_BUFFER_SIZE,
+                 flush_interval=FILE_FLUSH_INTERVAL,
+                 idle_timeout=FILE_IDLE_TIMEOUT):
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self._buffers = dict()
+        self._sizes = dict()
+
+        ## Open files, least recently used first, with their last use time
+        self._files = collections.OrderedDict()
+        self._flusher = None
+        self._stop = threading.Event()
+
+    def _check_fork(self):
+        """ In a forked child, drop the state inherited from the parent:
+        its buffers are the parent's to write, its lock may be held by a
+        thread which does not exist here, and its flusher does not run.
+        Children of :mod:`multiprocessing` leave via ``os._exit``, skipping
+        the atexit shutdown, so theirs is registered as a finalizer. """
+        if self._pid != os.getpid():
+            self._reset()
+            import multiprocessing.util
+            multiprocessing.util.Finalize(None, self.shutdown,
+                                          exitpriority=0)
+
+    def write(self, fname, data, urgent=False):
+        self._check_fork()
+        with self._lock:
+            try:
+                self._buffers[fname].append(data)
+                self._sizes[fname] += len(data)
+            except KeyError:
+                self._buffers[fname] = [data]
+                self._sizes[fname] = len(data)
+
+            if urgent or self._sizes[fname] >= self.buffer_size:
+                self._flush_file(fname)
+
+            if self._flusher is None:
+                self._start_flusher()
+
+    def _open(self, fname):
+        try:
+            stream, last_used = self._files.pop(fname)
+        except KeyError:
+            while len(self._files) >= self.max_open:
+                lru_fname, (lru_stream, lru_used) = \
+                    self._files.popitem(last=False)
+                lru_stream.close()
+            stream = open(fname, 'a')
+
+        ## Reinsert as the most recently used file
+        self._files[fname] = stream, time.time()
+        return stream
+
+    def _flush_file(self, fname):
+        buf = self._buffers.pop(fname, None)
+        self._sizes.pop(fname, None)
+        if not buf:
+            return
+        stream = self._open(fname)
+        stream.write("".join(buf))
+        stream.flush()
+
+    def flush(self, fname=None):
+        """ Write the buffer of *fname*, or all buffers. """
+        self._check_fork()
+        with self._lock:
+            fnames = [fname] if fname else list(self._buffers)
+            for fname in fnames:
+                self._flush_file(fname)
+
+    def release(self, fname):
+        """ Flush and close *fname*; it is reopened if written to again. """
+        self._check_fork()
+        with self._lock:
+            self._flush_file(fname)
+            try:
+                stream, last_used = self._files.pop(fname)
+            except KeyError:
+                return
+            stream.close()
+
+    def _close_idle(self):
+        now = time.time()
+        with self._lock:
+            for fname, (stream, last_used) in self._files.items():
+                if now - last_used >= self.idle_timeout:
+                    del self._files[fname]
+                    stream.close()
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop,
+                                         name="log-flusher")
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.flush_interval)
+            try:
+                self.flush()
+                self._close_idle()
+            except (IOError, OSError):
+                pass
+
+    def shutdown(self):
+        """ Stop the background flushing, flush all buffers and close all
+        files. """
+        self._check_fork()
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            self.flush()
+            for fname in list(self._files):
+                self.release(fname)
+
+
+_writer_pool = _WriterPool()
+
+## Stop flushing before the interpreter tears modules down
+atexit.register(_writer_pool.shutdown)
+
+
+############################################
+## ----- Memory-Mapped Log Segments ----- ##
+############################################
+
+def recover_segment(filename, chunk_size=1 << 16):
+    """ Trim the NUL padding off a log segment which was not closed (e.g.
+    the process has crashed), leaving only its records; return its length. """
+    with open(filename, 'r+b') as segment:
+        segment.seek(0, os.SEEK_END)
+        end = segment.tell()
+        while end > 0:
+            start = max(0, end - chunk_size)
+            segment.seek(start)
+            chunk = segment.read(end - start).rstrip('\0')
+            if chunk:
+                end = start + len(chunk)
+                break
+            end = start
+        segment.truncate(end)
+    return end
+
+
+class MmapFileHandler(logging.Handler):
+    """ A log file handler which copies records into a preallocated,
+    memory-mapped segment of *segment_size* bytes, so a record is written
+    without a system call. Once the segment is full, it is trimmed to its
+    real length and renamed with the next free numeric suffix (``name.1``,
+    ``name.2``, ...), and a new segment is started. A segment left behind
+    by a crash is readable, padded with NUL bytes; the padding is trimmed
+    when the file is opened again (see :func:`recover_segment`). Records of
+    level ERROR and above are synced to disk at once. A file should only be
+    written by one process. """
+    def __init__(self, filename, segment_size=MMAP_SEGMENT_SIZE):
+        logging.Handler.__init__(self)
+        self.baseFilename = os.path.abspath(filename)
+        self.segment_size = segment_size
+        self._mm = None
+        self._pos = 0
+
+    def _rollover_name(self):
+        index = 1
+        while os.path.exists("{}.{}".format(self.baseFilename, index)):
+            index += 1
+        return "{}.{}".format(self.baseFilename, index)
+
+    def _open(self, size):
+        """ Map the segment, with room for at least *size* more bytes. """
+        length = 0
+        if os.path.exists(self.baseFilename):
+            length = recover_segment(self.baseFilename)
+            if length and length + size > self.segment_size:
+                os.rename(self.baseFilename, self._rollover_name())
+                length = 0
+
+        total = max(self.segment_size, length + size)
+        fd = os.open(self.baseFilename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, total)
+            self._mm = mmap.mmap(fd, total)
+        finally:
+            os.close(fd)
+        self._pos = length
+
+    def _close_segment(self):
+        """ Unmap the segment, and trim it to its real length. """
+        mm, self._mm = self._mm, None
+        if mm is None:
+            return
+        mm.flush()
+        mm.close()
+        with open(self.baseFilename, 'r+b') as segment:
+            segment.truncate(self._pos)
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+            if isinstance(message, unicode):
+                message = message.encode('utf8')
+            _meter('mmap', record, message)
+            message += "\n"
+            size = len(message)
+
+            if self._mm is None:
+                self._open(size)
+            elif self._pos + size > len(self._mm):
+                self._close_segment()
+                os.rename(self.baseFilename, self._rollover_name())
+                self._open(size)
+
+            pos = self._pos
+            self._mm[pos:pos + size] = message
+            self._pos = pos + size
+            if record.levelno >= ERROR:
+                self._mm.flush()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._mm is not None:
+                self._mm.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._close_segment()
+        finally:
+            self.release()
+        logging.Handler.close(self)
+
+
 ##############################
 ## ----- Logger Proxy ----- ##
 ##############################
@@ -223,11 +780,12 @@ class Logger(logging.getLoggerClass()):
         """ A factory method for creation of KWLogRecords. """
         rec = KWLogRecord(name, level, fn, lno, msg, args, exc_info, func)
         if extra is not None:
+            rec._extra = dict()
             for key in extra:
-                if (key in ["message", "asctime"]) or (key in rec.__dict__):
+                if key in KWLogRecord.__slots__:
                     raise KeyError("Attempt to overwrite %r in LogRecord"
                                    % key)
-                rec.__dict__[key] = extra[key]
+                rec._extra[key] = extra[key]
         return rec
 
     def findCaller(self):
@@ -377,7 +935,7 @@ def _get_prompt_handler(prompt, color=False):
     return handler
 
 
-def _get_file_handler(filename):
+def _get_file_handler(filename, handler_klass=FileHandler):
     """ Instantiate and return a file handler for *filename*. Create all
     necessary paths. """
     ## Create all necessary paths
@@ -389,7 +947,7 @@ def _get_file_handler(filename):
             raise
 
     ## Instantiate handler
-    handler = logging.FileHandler(filename)
+    handler = handler_klass(filename)
 
     ## Set full formatter for handler
     formatter = get_formatter('full', 'full', datefmt=DATE_FMT)
@@ -399,9 +957,15 @@ def _get_file_handler(filename):
     return handler
 
 
+def _get_mmap_file_handler(filename):
+    """ Like :func:`_get_file_handler`, with a memory-mapped file handler. """
+    return _get_file_handler(filename, handler_klass=MmapFileHandler)
+
+
 _handler_klass_map = dict(
     prompt=_get_prompt_handler,
     file=_get_file_handler,
+    mmap=_get_mmap_file_handler,
 )
 
 
@@ -477,8 +1041,9 @@ def get_logger(name, level=DEBUG, prompt=None, color=None, relpath=None):
     if not _name:
         _name = _logger_daemon.root_name
     filename = os.path.join(_logger_daemon.root_path, _name) + ".log"
-    file_handler_name = "file://" + filename
-    file_handler = get_handler(file_handler_name, "file", level=level,
+    file_klass = _logger_daemon.file_klass
+    file_handler_name = file_klass + "://" + filename
+    file_handler = get_handler(file_handler_name, file_klass, level=level,
                                filename=filename)
     logger.add_handler(file_handler)
 
@@ -496,13 +1061,27 @@ def get_logger(name, level=DEBUG, prompt=None, color=None, relpath=None):
     return logger
 
 
+def set_level(level):
+    """ Set the level of all instantiated loggers and handlers to *level*;
+    this may be done at runtime, from any thread. """
+    _logger_daemon.loglevel = level
+    for logger in _instantiated_loggers.values():
+        logger.set_level(level)
+    for handler in _instantiated_handlers.values():
+        handler.setLevel(level)
+
+
 ################################
 ## ----- Main Component ----- ##
 ################################
 
 class SimpleLogger(qpyapp.base.Component):
     """ The simple logger overloads the app with debug/info/warn/error/critical
-    methods for logging, where the handler is the app's prompt method. """
+    methods for logging, where the handler is the app's prompt method. Log
+    files are written by the handler kind named by the app's *log_file_klass*
+    attribute (``'file'`` by default, or ``'mmap'``). """
+    depends = ('ArgParser', 'Config')
+
     def __init__(self, app):
         self.app = app
 
@@ -510,7 +1089,9 @@ class SimpleLogger(qpyapp.base.Component):
         ## Set logger
         loglevel = self.app_loglevel()
         logpath = self.app_logpath()
-        _logger_daemon.setup(name=self.app.name, path=logpath, level=loglevel)
+        file_klass = getattr(self.app, 'log_file_klass', None)
+        _logger_daemon.setup(name=self.app.name, path=logpath, level=loglevel,
+                             file_klass=file_klass)
         color_prompt = getattr(self.app, 'color_prompt', False)
         self.logger = get_logger("/", level=loglevel, prompt=self.app.prompt,
                                  color=color_prompt)
@@ -524,9 +1105,24 @@ class SimpleLogger(qpyapp.base.Component):
         self.app.critical = self.logger.critical
         self.app.loglevel = loglevel
 
+        ## Follow runtime changes of the verbosity
+        try:
+            config = self.app.config
+        except AttributeError:
+            pass
+        else:
+            config.subscribe('verbosity', self._set_verbosity)
+
         ## Log
         self.logger.info("Logger for app is set.")
 
+    def _set_verbosity(self, verbosity):
+        loglevel = level_dict[verbosity]
+        set_level(loglevel)
+        self.app.loglevel = loglevel
+        self.logger.info("Log level is set to {level_name}.",
+                         level_name=logging.getLevelName(loglevel))
+
     def app_loglevel(self):
         verbosity = self.app.parsed_args.get('verbosity', 0)
         return level_dict[verbosity]
@@ -0,0 +1,367 @@
+"""
+.. metrics.py
+
+A registry of metrics (counters, gauges and histograms) for apps and their
+components, exposed in Prometheus' text format.
+"""
+
+## Framework
+import qpyapp.base
+
+## Metrics
+import threading
+import collections
+
+## Exposition; the HTTP server is only imported by apps which serve
+import os
+BaseHTTPServer = qpyapp.base.lazy_import('BaseHTTPServer')
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+## Histogram buckets' upper bounds, in seconds: 1us, 2us, 4us, ..., ~17s
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+SNAPSHOT_INTERVAL = 10.0
+
+
+#########################
+## ----- Metrics ----- ##
+#########################
+
+class _Metric(object):
+    """ A metric family; with no labels, it is also its only series.
+    Updates are accumulated in per-thread shards, so hot loops never
+    contend on a lock; reads sum the shards up. """
+    kind = None
+
+    def __init__(self, name, help="", label_items=()):
+        self.name = name
+        self.help = help
+        self.label_items = label_items
+        self._children = collections.OrderedDict()
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        """ Return the series of this metric with the given *labels*. """
+        key = tuple(sorted(labels.iteritems()))
+        try:
+            return self._children[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = type(self)(self.name, self.help, key)
+        return self._children[key]
+
+    def _new_shard(self):
+        raise NotImplementedError
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._new_shard()
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def series(self):
+        """ Return the series of this metric: its labelled children, or
+        itself if it has none. """
+        if self._children:
+            return self._children.values()
+        return [self]
+
+
+class Counter(_Metric):
+    """ A monotonically increasing count. """
+    kind = 'counter'
+
+    def _new_shard(self):
+        return [0]
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    @property
+    def value(self):
+        return sum(shard[0] for shard in self._shards)
+
+
+class Gauge(_Metric):
+    """ A value which may go up and down; it is either set, or computed by a
+    function on every read. """
+    kind = 'gauge'
+
+    def __init__(self, name, help="", label_items=()):
+        super(Gauge, self).__init__(name, help, label_items)
+        self._value = 0
+        self._function = None
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        self._function = function
+
+    @property
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class _HistogramShard(object):
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram(_Metric):
+    """ A histogram of values (typically durations, in seconds) over
+    exponential buckets. """
+    kind = 'histogram'
+
+    def __init__(self, name="", help="", label_items=(), buckets=BUCKETS):
+        super(Histogram, self).__init__(name, help, label_items)
+        self.buckets = buckets
+
+    def labels(self, **labels):
+        child = super(Histogram, self).labels(**labels)
+        child.buckets = self.buckets
+        return child
+
+    def _new_shard(self):
+        return _HistogramShard(len(self.buckets) + 1)
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        shard = self._shard()
+        shard.counts[index] += 1
+        shard.count += 1
+        shard.sum += value
+        if value > shard.max:
+            shard.max = value
+
+    @property
+    def counts(self):
+        return [sum(column) for column in
+                zip(*[shard.counts for shard in self._shards])] or \
+            [0] * (len(self.buckets) + 1)
+
+    @property
+    def count(self):
+        return sum(shard.count for shard in self._shards)
+
+    @property
+    def sum(self):
+        return sum(shard.sum for shard in self._shards)
+
+    @property
+    def max(self):
+        return max([shard.max for shard in self._shards] or [0.0])
+
+    def quantile(self, q):
+        """ Return the upper bound of the bucket holding the *q* quantile. """
+        counts = self.counts
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                break
+        if index < len(self.buckets):
+            return min(self.buckets[index], self.max)
+        return self.max
+
+    def summary(self):
+        return ("{n} x, total {total:.2f} ms, p50 {p50:.3f} ms, "
+                "p99 {p99:.3f} ms, max {max:.3f} ms").format(
+            n=self.count, total=1000 * self.sum,
+            p50=1000 * self.quantile(0.5), p99=1000 * self.quantile(0.99),
+            max=1000 * self.max)
+
+
+##########################
+## ----- Registry ----- ##
+##########################
+
+def _label_text(label_items, extra=()):
+    items = tuple(label_items) + tuple(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in items) + "}"
+
+
+class Registry(object):
+    """ Holds metrics by name; asking for a metric which is already
+    registered returns it. """
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, klass, name, help, **kwargs):
+        try:
+            metric = self._metrics[name]
+        except KeyError:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = klass(name, help,
+                                                         **kwargs)
+        if not isinstance(metric, klass):
+            raise ValueError("Metric {} is a {}".format(name, metric.kind))
+        return metric
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def metrics(self):
+        return self._metrics.values()
+
+    def exposition(self):
+        """ Return all metrics in Prometheus' text exposition format. """
+        lines = []
+        for metric in self.metrics():
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for series in metric.series():
+                labels = series.label_items
+                if metric.kind != 'histogram':
+                    lines.append("{}{} {!r}".format(
+                        metric.name, _label_text(labels), series.value))
+                    continue
+
+                cumulative = 0
+                counts = series.counts
+                for bound, count in zip(series.buckets, counts):
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(
+                        metric.name,
+                        _label_text(labels, [('le', repr(bound))]),
+                        cumulative))
+                lines.append("{}_bucket{} {}".format(
+                    metric.name, _label_text(labels, [('le', "+Inf")]),
+                    cumulative + counts[-1]))
+                lines.append("{}_sum{} {!r}".format(
+                    metric.name, _label_text(labels), series.sum))
+                lines.append("{}_count{} {}".format(
+                    metric.name, _label_text(labels), series.count))
+        return "\n".join(lines) + "\n"
+
+
+## The default registry
+registry = Registry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+
+
+############################
+## ----- Exposition ----- ##
+############################
+
+def _request_handler(registry):
+    """ Return an HTTP request handler class, serving *registry*. """
+    class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.exposition()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsRequestHandler
+
+
+class MetricsComp(qpyapp.base.Component):
+    """ Exposes the metrics registry. If the app has a *metrics_port*
+    attribute, it is served over HTTP on the local host at that port (any
+    path will do); if it has a *metrics_fname* attribute, a snapshot of it
+    is written to that file every *metrics_interval* seconds, and on exit.
+    The component overloads the app with a *metrics* property, the
+    registry. """
+    def __init__(self, app):
+        self.app = app
+        self.registry = registry
+        self.port = getattr(app, 'metrics_port', None)
+        self.fname = getattr(app, 'metrics_fname', None)
+        self.interval = getattr(app, 'metrics_interval', SNAPSHOT_INTERVAL)
+        self._server = None
+        self._threads = []
+        self._stop = threading.Event()
+
+        ## Overload
+        app_cls = type(app)
+        app_cls.metrics = property(lambda app: self.registry)
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name)
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def start(self):
+        if self.port:
+            self._server = BaseHTTPServer.HTTPServer(
+                ('127.0.0.1', self.port), _request_handler(self.registry))
+            self._spawn(self._server.serve_forever, "metrics-http")
+
+        if self.fname:
+            self._spawn(self._snapshot_loop, "metrics-snapshot")
+
+    def snapshot(self):
+        """ Write the metrics to the app's *metrics_fname*, atomically. """
+        tmp_fname = "{}.{}".format(self.fname, os.getpid())
+        with open(tmp_fname, 'w') as snapshot_file:
+            snapshot_file.write(self.registry.exposition())
+        os.rename(tmp_fname, self.fname)
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.interval) and \
+                not self._stop.is_set():
+            try:
+                self.snapshot()
+            except (IOError, OSError):
+                pass
+
+    def exit(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self.fname:
+            try:
+                self.snapshot()
+            except (IOError, OSError):
+                pass
@@ -0,0 +1,105 @@
+"""
+.. output.py
+
+Coalesced, rate-limited terminal output for apps.
+"""
+
+## Output
+import time
+import threading
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+## Flushes per second
+REFRESH_RATE = 20
+
+## A buffer of this many bytes is flushed at once
+MAX_BUFFER = 1 << 16
+
+## Lines written per flush beyond this many are summarized rather than shown
+MAX_LINES = 200
+
+
+class BufferedConsole(object):
+    """ Coalesces messages into a buffer, which is passed to *sink* (a
+    callable accepting text) at most *refresh_rate* times a second, or once
+    it has *max_buffer* bytes; a background thread flushes what is left.
+    Under overload, messages beyond the first *max_lines* of a flush are
+    counted, and only a summary line is shown for them.
+
+    The sink is called from whichever thread flushes (a writer, or the
+    background flusher thread), with the console's lock held, so messages
+    keep their order; it must be thread-safe, and must not write to the
+    console itself. """
+    def __init__(self, sink, refresh_rate=REFRESH_RATE, max_buffer=MAX_BUFFER,
+                 max_lines=MAX_LINES):
+        self.sink = sink
+        self.period = 1.0 / refresh_rate
+        self.max_buffer = max_buffer
+        self.max_lines = max_lines
+        self.suppressed = 0
+        self._buf = []
+        self._size = 0
+        self._dropped = 0
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def write(self, msg):
+        with self._lock:
+            if len(self._buf) < self.max_lines:
+                self._buf.append(msg)
+                self._size += len(msg) + 1
+            else:
+                self._dropped += 1
+
+            now = time.time()
+            if self._size >= self.max_buffer or \
+                    now - self._last_flush >= self.period:
+                self._flush(now)
+
+            if self._flusher is None:
+                self._start_flusher()
+
+    def _flush(self, now):
+        """ Pass the buffer to the sink; the lock must be held. """
+        self._last_flush = now
+        if not self._buf and not self._dropped:
+            return
+
+        lines = self._buf
+        if self._dropped:
+            lines.append("[... {} more messages suppressed ...]".format(
+                self._dropped))
+            self.suppressed += self._dropped
+        self._buf = []
+        self._size = 0
+        self._dropped = 0
+        self.sink("\n".join(lines))
+
+    def flush(self):
+        with self._lock:
+            self._flush(time.time())
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop,
+                                         name="console-flusher")
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.period)
+            self.flush()
+
+    def close(self):
+        """ Stop the background flushing and flush what is left. """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
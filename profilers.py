@@ -6,16 +6,29 @@ Profiling facilities for apps.
 
 ## Framework
 import qpyapp.base
+import qpyapp.flamegraph as flg
+import qpyapp.profstats as pfs
 import cProfile as profile
-import subprocess as sp
 import types
+import os
 
 
 class Profiler(qpyapp.base.Component):
     """ The :class:`Profiler` component wrap's the run method of its app with
     profiling facilities. If the app has a *prof_fname* attribute, it saves the
-    stats to that file. If it also has a *prof_img_fname* attribute, is creates
-    a profile image at that path.
+    stats to that file. If it has a *prof_img_fname* attribute, it renders an
+    SVG flamegraph (an icicle chart followed by a table of the hottest
+    functions) at that path, and if it has a *prof_top_fname* attribute, it
+    writes the hot functions table as text to that path. Rendering is done in
+    process, with no need for external tools.
+
+    When several processes (e.g. workers) profile, a ``{pid}`` field in
+    *prof_fname* is replaced with the process id, so that each writes its own
+    dump; these may be combined with :func:`qpyapp.profstats.merge_stats`. If
+    the app has a *prof_baseline_fname* attribute, the profile is compared to
+    that dump and every function which has regressed by more than the app's
+    *prof_threshold* (defaults to :data:`qpyapp.profstats.THRESHOLD`) is
+    reported as a warning.
 
     To make profiling optional, the component looks for *profile* attribute of
     the app. It only profiles if it finds one and it is ``True``. """
@@ -43,25 +56,61 @@ class Profiler(qpyapp.base.Component):
             except AttributeError:
                 pass
             else:
-                app.info("Dumping profile stats...")
+                prof_fname = prof_fname.format(pid=os.getpid())
+                app.info("Dumping profile stats to {fname}...",
+                         fname=prof_fname)
                 profiler.dump_stats(prof_fname)
 
+            ## Compare stats to a baseline
+            try:
+                prof_baseline_fname = app.prof_baseline_fname
+            except AttributeError:
+                pass
+            else:
+                app.info("Comparing profile stats to {fname}...",
+                         fname=prof_baseline_fname)
+                threshold = getattr(app, 'prof_threshold', pfs.THRESHOLD)
+                try:
+                    diffs = pfs.diff_stats(prof_baseline_fname, profiler,
+                                           threshold=threshold)
+                except (IOError, OSError):
+                    app.error("Could not read baseline profile {fname}.",
+                              fname=prof_baseline_fname, exc_info=True)
+                else:
+                    regressed = pfs.regressions(diffs)
+                    if regressed:
+                        app.warning("{count} function(s) regressed:\n{table}",
+                                    count=len(regressed),
+                                    table=pfs.format_diff(regressed))
+
             ## Plot stats
             try:
-                prof_fname = app.prof_fname
                 prof_img_fname = app.prof_img_fname
             except AttributeError:
                 pass
             else:
                 app.info("Plotting profile stats...")
-                gprof_cmd = ['gprof2dot', '-f', 'pstats', prof_fname]
-                dot_cmd = ['dot', '-T', 'png', '-o', prof_img_fname]
-                gprof_proc = sp.Popen(gprof_cmd, stdout=sp.PIPE)
                 try:
-                    sp.check_call(dot_cmd, stdin=gprof_proc.stdout)
-                    gprof_proc.wait()
-                except sp.CalledProcessError:
-                    self.error("gprof2dot has failed.")
+                    flg.render_svg(flg.load_stats(profiler), prof_img_fname,
+                                   title=getattr(app, 'name', "Profile"))
+                except (IOError, OSError):
+                    app.error("Could not plot profile stats to {fname}.",
+                              fname=prof_img_fname, exc_info=True)
+
+            ## Tabulate hot functions
+            try:
+                prof_top_fname = app.prof_top_fname
+            except AttributeError:
+                pass
+            else:
+                app.info("Tabulating hot functions...")
+                try:
+                    with open(prof_top_fname, 'w') as top_file:
+                        top_file.write(
+                            flg.format_top(flg.load_stats(profiler)))
+                except (IOError, OSError):
+                    app.error("Could not write hot functions to {fname}.",
+                              fname=prof_top_fname, exc_info=True)
 
         app.run = types.MethodType(run, app, type(app))
 
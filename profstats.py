@@ -0,0 +1,243 @@
+"""
+.. profstats.py
+
+Aggregation and differential comparison of profile stats dumps, e.g. those
+written by the :class:`qpyapp.profilers.Profiler` component of several runs
+or worker processes.
+
+It may also be used from the command line::
+
+    python -m qpyapp.profstats merge -o all.prof worker-*.prof
+    python -m qpyapp.profstats diff base.prof new.prof --threshold 0.2
+"""
+
+## Profile stats
+import pstats
+import qpyapp.flamegraph as flg
+
+## Command line
+import sys
+import argparse as ap
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+## A function has regressed if its self or cumulative time grew by more than
+## this fraction...
+THRESHOLD = 0.1
+
+## ... and by more than this many seconds, so noise in tiny functions is not
+## reported
+MIN_DELTA = 0.001
+
+
+#########################
+## ----- Merging ----- ##
+#########################
+
+def merge_stats(sources):
+    """ Merge the profile stats *sources* (stats dump file names,
+    :class:`cProfile.Profile` or :class:`pstats.Stats` instances) into a
+    single :class:`pstats.Stats` instance, summing up times and call counts
+    per function. """
+    sources = list(sources)
+    if not sources:
+        raise ValueError("No profile stats to merge.")
+
+    ## A Stats instance cannot be loaded by pstats.Stats, only added to;
+    ## the merge is seeded with a copy of its stats, leaving it untouched
+    first = sources[0]
+    if isinstance(first, pstats.Stats):
+        first = _StatsCopy(first.stats)
+    merged = pstats.Stats(first)
+    for source in sources[1:]:
+        merged.add(source)
+    return merged
+
+
+class _StatsCopy(object):
+    """ A copy of raw *stats*, which pstats.Stats may load. """
+    def __init__(self, stats):
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        pass
+
+
+def _stats(source):
+    if isinstance(source, dict):
+        return source
+    return flg.load_stats(source)
+
+
+#########################
+## ----- Diffing ----- ##
+#########################
+
+class FuncDiff(object):
+    """ The difference of a single function's stats between a base profile
+    and a new profile. A function missing from one of the profiles has zero
+    times and calls there. """
+    __slots__ = ('func', 'base_tt', 'new_tt', 'base_ct', 'new_ct',
+                 'base_calls', 'new_calls', 'regressed')
+
+    def __init__(self, func, base, new):
+        self.func = func
+        self.base_calls, self.base_tt, self.base_ct = base
+        self.new_calls, self.new_tt, self.new_ct = new
+        self.regressed = False
+
+    @property
+    def tt_delta(self):
+        return self.new_tt - self.base_tt
+
+    @property
+    def ct_delta(self):
+        return self.new_ct - self.base_ct
+
+    @property
+    def calls_delta(self):
+        return self.new_calls - self.base_calls
+
+    @staticmethod
+    def _ratio(base, new):
+        if base:
+            return (new - base) / base
+        return float('inf') if new else 0.0
+
+    @property
+    def tt_ratio(self):
+        return self._ratio(self.base_tt, self.new_tt)
+
+    @property
+    def ct_ratio(self):
+        return self._ratio(self.base_ct, self.new_ct)
+
+    @property
+    def label(self):
+        return flg.func_label(self.func)
+
+
+_zero = (0, 0.0, 0.0)
+
+
+def diff_stats(base, new, threshold=THRESHOLD, min_delta=MIN_DELTA):
+    """ Compare the *base* and *new* profiles (anything :func:`merge_stats`
+    accepts, or raw stats dictionaries) per function. Return a list of
+    :class:`FuncDiff` instances, sorted by the growth of self time, largest
+    first. Functions whose self or cumulative time grew by more than
+    *threshold* (relative) and *min_delta* (seconds) are flagged as
+    regressed. """
+    base, new = _stats(base), _stats(new)
+
+    diffs = []
+    for func in set(base).union(new):
+        try:
+            cc, nc, tt, ct, callers = base[func]
+            base_values = (nc, tt, ct)
+        except KeyError:
+            base_values = _zero
+        try:
+            cc, nc, tt, ct, callers = new[func]
+            new_values = (nc, tt, ct)
+        except KeyError:
+            new_values = _zero
+
+        diff = FuncDiff(func, base_values, new_values)
+        diff.regressed = (
+            (diff.tt_delta > min_delta and diff.tt_ratio > threshold) or
+            (diff.ct_delta > min_delta and diff.ct_ratio > threshold))
+        diffs.append(diff)
+
+    diffs.sort(key=lambda diff: diff.tt_delta, reverse=True)
+    return diffs
+
+
+def regressions(diffs):
+    """ Return only the regressed function diffs out of *diffs*. """
+    return [diff for diff in diffs if diff.regressed]
+
+
+def _pct(ratio):
+    if ratio == float('inf'):
+        return "new"
+    return "{:+.1f}%".format(100.0 * ratio)
+
+
+def format_diff(diffs, n=flg.TOP_N):
+    """ Return a text table of the first *n* function diffs in *diffs*;
+    regressed functions are marked with a ``!``. """
+    lines = ["  {:>10} {:>8} {:>10} {:>8} {:>9}  {}".format(
+        "d self (s)", "self", "d cum (s)", "cum", "d calls", "function")]
+    for diff in diffs[:n]:
+        lines.append("{} {:>+10.4f} {:>8} {:>+10.4f} {:>8} {:>+9}  {}".format(
+            "!" if diff.regressed else " ", diff.tt_delta,
+            _pct(diff.tt_ratio), diff.ct_delta, _pct(diff.ct_ratio),
+            diff.calls_delta, diff.label))
+    return "\n".join(lines) + "\n"
+
+
+##############################
+## ----- Command Line ----- ##
+##############################
+
+def _merge_main(args):
+    merged = merge_stats(args.fnames)
+    merged.dump_stats(args.output)
+    if args.top:
+        sys.stdout.write(flg.format_top(merged.stats, args.top))
+    return 0
+
+
+def _diff_main(args):
+    base = merge_stats(args.base)
+    new = merge_stats(args.new)
+    diffs = diff_stats(base, new, threshold=args.threshold,
+                       min_delta=args.min_delta)
+    sys.stdout.write(format_diff(diffs, args.top))
+
+    regressed = regressions(diffs)
+    if regressed:
+        sys.stdout.write("\n{} function(s) regressed.\n".format(
+            len(regressed)))
+        return 1
+    return 0
+
+
+def main(argv=None):
+    """ Command line entry point; return an exit status, which is non-zero
+    if a diff has found regressions. """
+    parser = ap.ArgumentParser(
+        prog="python -m qpyapp.profstats",
+        description="Merge and compare profile stats dumps.")
+    commands = parser.add_subparsers()
+
+    merge = commands.add_parser('merge', help="merge several dumps into one")
+    merge.add_argument('fnames', nargs='+', help="stats dumps to merge")
+    merge.add_argument('-o', '--output', required=True,
+                       help="merged stats dump file name")
+    merge.add_argument('--top', type=int, default=0,
+                       help="also print the N hottest functions")
+    merge.set_defaults(func=_merge_main)
+
+    diff = commands.add_parser('diff', help="compare a new profile to a base")
+    diff.add_argument('base', help="base stats dump(s), comma separated",
+                      type=lambda value: value.split(','))
+    diff.add_argument('new', help="new stats dump(s), comma separated",
+                      type=lambda value: value.split(','))
+    diff.add_argument('--threshold', type=float, default=THRESHOLD,
+                      help="relative growth considered a regression")
+    diff.add_argument('--min-delta', type=float, default=MIN_DELTA,
+                      help="absolute growth (seconds) considered noise")
+    diff.add_argument('--top', type=int, default=flg.TOP_N,
+                      help="number of functions to print")
+    diff.set_defaults(func=_diff_main)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
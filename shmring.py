@@ -0,0 +1,259 @@
+"""
+.. shmring.py
+
+A shared-memory ring buffer, carrying byte payloads from an engine-side
+producer to worker processes without pickling or copying them.
+"""
+
+## Framework
+import qpyapp.base
+
+## Shared memory
+import time
+import mmap
+import struct
+import multiprocessing as mp
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+SLOTS = 1024
+SLOT_SIZE = 1 << 16
+
+## Slot states
+FREE, FILLED, TAKEN = 0, 1, 2
+
+## Each slot starts with the length of its payload
+_length = struct.Struct("=I")
+
+## Seconds to wait for data before an engine's batch ends
+WAIT = 0.1
+
+
+class Full(Exception):
+    pass
+
+
+class Empty(Exception):
+    pass
+
+
+class Closed(Exception):
+    pass
+
+
+def _view(mm, offset, size):
+    """ A zero-copy, read-only view of *size* bytes of *mm* at *offset*. """
+    try:
+        return memoryview(mm)[offset:offset + size]
+    except TypeError:
+        ## Python 2's mmap only has the old buffer interface
+        return buffer(mm, offset, size)
+
+
+#######################
+## ----- Slots ----- ##
+#######################
+
+class Slot(object):
+    """ A payload taken out of the ring. Its *data* is a view into shared
+    memory, valid until the slot is released; :meth:`release` must be called
+    once the payload is processed, or the producer will run out of slots.
+    Slots may also be used as context managers, releasing on exit. """
+    __slots__ = ('ring', 'index', 'data')
+
+    def __init__(self, ring, index, data):
+        self.ring = ring
+        self.index = index
+        self.data = data
+
+    def release(self):
+        if self.index is not None:
+            self.data = None
+            self.ring._release(self.index)
+            self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+######################
+## ----- Ring ----- ##
+######################
+
+class ShmRing(object):
+    """ A ring of *slots* slots of up to *slot_size* bytes each, in an
+    anonymous shared memory map, so it is shared with the processes forked
+    (e.g. by :mod:`multiprocessing`) after it is created.
+
+    A single producer :meth:`put`\\ s payloads, copying each into shared
+    memory once; any number of consumers :meth:`get` them, in order, as
+    :class:`Slot` views. A slot is only reused once its consumer has
+    released it; until then the producer waits (or, once its timeout has
+    passed, :meth:`put` raises :class:`Full`), which is the ring's
+    backpressure. """
+    def __init__(self, slots=SLOTS, slot_size=SLOT_SIZE):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._stride = _length.size + slot_size
+
+        ## Layout: a closed flag, the slot states, then the slots
+        self._states = 1
+        self._data = self._states + slots
+        self._mm = mmap.mmap(-1, self._data + slots * self._stride)
+
+        ## Producer side; the producer is a single process
+        self._write_index = 0
+        self._released = mp.Condition()
+
+        ## Consumer side
+        self._filled = mp.Semaphore(0)
+        self._read_lock = mp.Lock()
+        self._read_index = mp.RawValue('L', 0)
+
+    @property
+    def closed(self):
+        return self._mm[0] != '\0'
+
+    def _state(self, index):
+        return ord(self._mm[self._states + index])
+
+    def _set_state(self, index, state):
+        self._mm[self._states + index] = chr(state)
+
+    def put(self, data, timeout=None):
+        """ Copy *data* (a string or buffer) into the next slot, waiting up
+        to *timeout* seconds (forever if ``None``) for it to be released. """
+        size = len(data)
+        if size > self.slot_size:
+            raise ValueError("Payload of {} bytes exceeds the slot size of {}"
+                             .format(size, self.slot_size))
+        if self.closed:
+            raise Closed()
+
+        ## Wait for the slot to be released; any slot's release wakes us
+        index = self._write_index
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._released:
+            while self._state(index) != FREE:
+                if timeout is None:
+                    self._released.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Full()
+                self._released.wait(remaining)
+
+        ## Python 2's mmap only takes strings in slice assignments, but
+        ## writes any buffer
+        offset = self._data + index * self._stride
+        self._mm.seek(offset)
+        self._mm.write(_length.pack(size))
+        self._mm.write(data)
+        self._set_state(index, FILLED)
+        self._write_index = (index + 1) % self.slots
+        self._filled.release()
+
+    def get(self, timeout=None):
+        """ Take the next payload, waiting up to *timeout* seconds (forever
+        if ``None``); raise :class:`Empty` if there is none, or
+        :class:`Closed` if there is none and the ring is closed. """
+        ## Without a timeout, wait in steps, to notice the ring is closed
+        if timeout is None:
+            while not self._filled.acquire(True, WAIT):
+                if self.closed:
+                    raise Closed()
+        elif not self._filled.acquire(True, timeout):
+            if self.closed:
+                raise Closed()
+            raise Empty()
+
+        with self._read_lock:
+            index = self._read_index.value
+            self._read_index.value = (index + 1) % self.slots
+        self._set_state(index, TAKEN)
+
+        offset = self._data + index * self._stride
+        size, = _length.unpack(
+            self._mm[offset:offset + _length.size])
+        return Slot(self, index, _view(self._mm, offset + _length.size, size))
+
+    def _release(self, index):
+        with self._released:
+            self._set_state(index, FREE)
+            self._released.notify_all()
+
+    def close(self):
+        """ Mark the ring as closed; consumers get :class:`Closed` once they
+        have taken all the remaining payloads. """
+        self._mm[0] = chr(1)
+
+
+##########################
+## ----- Adapters ----- ##
+##########################
+
+class RingEngine(object):
+    """ An engine for :class:`qpyapp.eventdriven.EventDrivenApplication`
+    workers, whose events are the :class:`Slot`\\ s of *ring*; the app is
+    responsible for releasing them (see :class:`SlotReleaser`). A batch ends
+    once no payload has arrived for *wait* seconds. """
+    using_term = False
+    Off = Closed
+
+    def __init__(self, ring, wait=WAIT):
+        self.ring = ring
+        self.wait = wait
+
+    @property
+    def details(self):
+        return "shared-memory ring of {} x {} bytes".format(
+            self.ring.slots, self.ring.slot_size)
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.ring.get(self.wait)
+            except Empty:
+                return
+
+    def close(self):
+        pass
+
+
+class RingFeeder(object):
+    """ The producer side: puts the (byte string) events of *engine* into
+    *ring*, until the engine is off; then closes the ring. After a batch
+    with no events, it waits *wait* seconds before asking for more. """
+    def __init__(self, ring, engine, wait=WAIT):
+        self.ring = ring
+        self.engine = engine
+        self.wait = wait
+
+    def run(self):
+        off = getattr(self.engine, 'Off', Closed)
+        try:
+            while True:
+                count = 0
+                for count, event in enumerate(self.engine, 1):
+                    self.ring.put(event)
+                if not count:
+                    time.sleep(self.wait)
+        except off:
+            pass
+        finally:
+            self.ring.close()
+
+
+class SlotReleaser(qpyapp.base.Component):
+    """ Releases each event's slot once the app is done with it (even if
+    processing it failed, or it was dropped or merged away), for apps whose
+    *process* does not keep payloads beyond the call. """
+    def event_done(self, app, event):
+        event.release()
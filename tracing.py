@@ -0,0 +1,120 @@
+"""
+.. tracing.py
+
+Span tracing for apps, exported as Chrome trace-event JSON (which may be
+viewed in ``chrome://tracing`` or Perfetto).
+"""
+
+## Tracing
+import os
+import time
+import thread
+import random
+import collections
+
+## Export
+import json
+
+
+##################################
+## ----- Module Constants ----- ##
+##################################
+
+## Spans kept in memory; older ones are dropped
+SPANS = 1 << 16
+
+
+########################
+## ----- Tracer ----- ##
+########################
+
+class _Span(object):
+    """ A context manager recording a span around its block. """
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.add(self.name, self.cat, self.start,
+                        time.time() - self.start, **self.args)
+
+
+class Tracer(object):
+    """ Records spans (a name, a category, a start time and a duration, in
+    seconds) into a buffer of the last *size* spans. Lifecycle spans are
+    always recorded; per-event ones only for the *sample_rate* fraction of
+    the events, so tracing may be left on under load. """
+    def __init__(self, size=SPANS, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self.spans = collections.deque(maxlen=size)
+        self.pid = os.getpid()
+
+    def sampled(self):
+        """ Whether to trace the next event. """
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def add(self, name, cat, start, duration, **args):
+        self.spans.append((name, cat, start, duration, thread.get_ident(),
+                           args))
+
+    def span(self, name, cat, **args):
+        """ Return a context manager, recording a span around its block. """
+        return _Span(self, name, cat, args)
+
+    def events(self):
+        """ Return the spans as a list of trace events. """
+        return [dict(name=name, cat=cat, ph='X', ts=1e6 * start,
+                     dur=1e6 * duration, pid=self.pid, tid=tid, args=args)
+                for name, cat, start, duration, tid, args in list(self.spans)]
+
+    def export(self, fname):
+        """ Write the spans to *fname*, in the trace-event JSON format. """
+        with open(fname, 'w') as trace_file:
+            json.dump(dict(traceEvents=self.events(), displayTimeUnit='ms'),
+                      trace_file)
+
+
+###############################
+## ----- Event Tracing ----- ##
+###############################
+
+class DispatchTracer(object):
+    """ Wraps an event-driven app's dispatch, tracing (a sample of) the
+    events: a span of the processing of each, and a span of the time the
+    engine took to produce it. Call :meth:`batch` as each batch starts, so
+    the time between batches is not taken for an engine wait. """
+    def __init__(self, tracer, dispatch):
+        self.tracer = tracer
+        self.dispatch = dispatch
+        self._last = None
+
+    def batch(self, start):
+        self._last = start
+
+    def __call__(self, event):
+        tracer = self.tracer
+        if not tracer.sampled():
+            try:
+                self.dispatch(event)
+            finally:
+                self._last = time.time()
+            return
+
+        _t0 = time.time()
+        if self._last is not None:
+            tracer.add('engine', 'engine', self._last, _t0 - self._last)
+        with tracer.span('process', 'event'):
+            try:
+                self.dispatch(event)
+            finally:
+                self._last = time.time()